@@ -0,0 +1,45 @@
+import argparse
+from typing import Set, Tuple
+from sqlalchemy import select
+from sqlalchemy.orm.session import Session
+
+from .migrate_images import IMAGE_COLUMNS
+from .util.database import SessionLocal
+from .util.image_store import IMAGE_STORE
+from .util.image_variants import Image, build_variants
+
+def stored_images(db: Session) -> Set[Tuple[str, str]]:
+    """(sha256, mime) of every image referenced by the catalog; shared images appear once."""
+    images = set()
+    for model, _, prefix in IMAGE_COLUMNS:
+        sha256 = getattr(model, f"{prefix}_sha256")
+        mime = getattr(model, f"{prefix}_mime")
+        images.update((row_sha256, row_mime) for row_sha256, row_mime in db.execute(select(sha256, mime).where(sha256.isnot(None))))
+    return images
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the resized / WebP renditions of the images already in the image store.")
+    parser.add_argument("--force", action="store_true", help="Rebuild existing renditions (e.g. after changing IMAGE_VARIANT_WEBP_QUALITY).")
+    args = parser.parse_args()
+
+    if Image is None:
+        print("Pillow is not installed (pip install Pillow); nothing to do.")
+        return
+
+    with SessionLocal() as db:
+        images = sorted(stored_images(db))
+
+    print(f"Building renditions of {len(images)} images in {IMAGE_STORE.root.resolve()}...")
+    written = missing = 0
+    for count, (sha256, mime) in enumerate(images, start=1):
+        if not IMAGE_STORE.exists(sha256):
+            missing += 1
+            continue
+        written += build_variants(sha256, mime, force=args.force)
+        if count % 50 == 0:
+            print(f"  - {count}/{len(images)}")
+
+    print(f"Done. {written} renditions written, {missing} images missing from the store.")
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
+from typing import Dict, List, Optional, Tuple
 
 class Settings(BaseSettings):
     # --- Auth Settings ---
@@ -6,9 +7,42 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"
     TOKEN_EXPIRE: int = 30 # Minutes
     
-    CACHE_TYPE: str = "memory"
+    GACHA_BATCH_MAX_PULLS: int = 1000 # Upper bound for /gacha/{banner_id}/pull_batch
+
+    ACHIEVEMENT_MODE: str = "sync" # sync or async (checked by a background worker pool after the pull is saved)
+    ACHIEVEMENT_WORKERS: int = 2
+    ACHIEVEMENT_QUEUE_SIZE: int = 1000 # Pulls waiting for a check; when full, the pull checks synchronously
+
+    CACHE_TYPE: str = "memory" # memory, redis or tiered (in-process L1 + Redis)
     CACHE_EXPIRE: int = 180 
+    CACHE_CODEC: str = "orjson" # orjson, msgpack or json
+    CACHE_STALE_TTL: int = 60 # Seconds a value may be served stale while one request refreshes it
+    CACHE_LOCK_TIMEOUT: float = 5.0 # Max seconds a request waits for another one computing the same key
+    CACHE_DISTRIBUTED_LOCK: bool = False # Also single-flight across workers with a Redis lock
+    CACHE_MEMORY_MAX_ENTRIES: int = 10000 # LRU limits of the memory cache (0 = unlimited)
+    CACHE_MEMORY_MAX_BYTES: int = 64 * 1024 * 1024
+    # Namespaces held in process by the tiered cache: namespace -> (max entries, TTL seconds).
+    # Deletes reach every worker through the invalidation bus, so TTLs can be long.
+    # Each cached value takes two entries (value + freshness marker).
+    CACHE_L1_NAMESPACES: Dict[str, Tuple[int, int]] = {
+        "all_banners": (2, 3600),
+        "all_schools": (2, 3600),
+        "image": (4096, 86400),
+    }
+    # Fill the caches before the worker takes traffic (see util/warmup.py)
+    CACHE_WARMUP: bool = True
+    CACHE_WARMUP_BUDGET: float = 10.0 # Seconds; what is left is computed by the first requests
+    CACHE_WARMUP_CONCURRENCY: int = 8
+    CACHE_WARMUP_BASE_URL: Optional[str] = None # Public origin (e.g. https://gacha.example.com) of the cached image URLs; unset, responses with URLs are not warmed
+    IMAGE_STORE_DIR: str = "./image_store" # Content-addressed image files (see util/image_store.py)
+    IMAGE_CACHE_EXPIRE: int = 86400 # Image metadata (digest, MIME type, filename); cleared on catalog changes
+    # Resized renditions built at ingest and served with ?w= / ?format=webp (see util/image_variants.py)
+    IMAGE_VARIANT_WIDTHS: List[int] = [64, 128, 256, 512]
+    IMAGE_VARIANT_WEBP_QUALITY: int = 80
+    SPRITE_TILE_WIDTHS: List[int] = [64, 128, 256] # Accepted ?w= of the sprite sheets; each one is a sheet per page
     REDIS_URL: str = "redis://localhost:6379"
+    METRICS_ENABLED: bool = True # Cache and request metrics on /metrics (Prometheus text format)
+    METRICS_TOKEN: Optional[str] = None # Bearer token the scraper must send to /metrics; unset, /metrics is not served
     APP_NAME: str = "Blue Archive Gacha Simulator (Backend)"
     LOG_LEVEL: str = "INFO"
     DEBUG_MODE: bool = False
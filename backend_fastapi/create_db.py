@@ -3,12 +3,14 @@ import base64
 import hashlib
 from decimal import Decimal
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from sqlalchemy.orm.session import Session
 
 # Important: This script assumes it is run from the `backend` directory.
 # It uses relative paths to find the database and data files.
-from .util.database import Base, SessionLocal, engine
+from .util.database import Base, SessionLocal, add_missing_columns, engine
+from .util.image_store import image_columns
+from .util.image_variants import store_image
 from .util.models import Version, School, ImageAsset, Student, GachaPreset, GachaBanner, Role, Achievement
 
 # Define the path to your data directory
@@ -78,7 +80,7 @@ def seed_schools(db: Session):
         exists = db.query(School).filter_by(name=name).first()
         if not exists:
             image_bytes = base64.b64decode(image_b64)
-            new_school = School(name=name, image_data=image_bytes)
+            new_school = School(name=name, **image_columns("image", store_image(image_bytes)))
             db.add(new_school)
             print(f"  - Added School: {name}")
     db.commit()
@@ -136,8 +138,8 @@ def seed_students(db: Session):
             combined_hash = hashlib.sha256(f"{p_hash}-{f_hash}".encode()).hexdigest()
 
             new_asset = ImageAsset(
-                portrait_data=portrait_bytes,
-                artwork_data=artwork_bytes,
+                **image_columns("portrait", store_image(portrait_bytes)),
+                **image_columns("artwork", store_image(artwork_bytes)),
                 pair_hash=combined_hash
             )
             db.add(new_asset)
@@ -215,7 +217,7 @@ def seed_banners(db: Session):
 
             new_banner = GachaBanner(
                 name=banner_name,
-                image_data=image_bytes,
+                **image_columns("image", store_image(image_bytes)),
                 include_limited=banner_limited,
                 included_versions=version_obj_list,
                 preset_id=preset_obj.id,
@@ -225,8 +227,22 @@ def seed_banners(db: Session):
             print(f"  - Added Banner: {banner_name}")
     db.commit()
 
+def _resolve_required_students(db: Session, ach_data: Dict[str, Any]) -> Optional[List[Student]]:
+    """Resolves the 'students' list of a collection file. Returns None if any member is missing."""
+    required_students = []
+    for member in ach_data.get('students', []):
+        student = db.query(Student).join(Version).filter(
+            Student.name == member['name'],
+            Version.name == member['version']
+        ).first()
+        if not student:
+            print(f"  - SKIPPING requirements of {ach_data['key']}: Missing student {member['name']} ({member['version']}).")
+            return None
+        required_students.append(student)
+    return required_students
+
 def seed_achievements(db: Session):
-    """Seeds the Achievement table from the achievements/ directory."""
+    """Seeds the Achievement table (and collection requirements) from the achievements/ directory."""
     print("\nSeeding Achievements...")
     all_achievement_data = load_json_files_from_dir(DATA_DIR / "achievements")
     
@@ -237,8 +253,8 @@ def seed_achievements(db: Session):
             continue
 
         # Check if an achievement with this unique key already exists
-        exists = db.query(Achievement.id).filter_by(key=key).first()
-        if not exists:
+        achievement = db.query(Achievement).filter_by(key=key).first()
+        if not achievement:
 
             category = ach_data.get('category', 'MILESTONE')
             name = ach_data.get('name', 'Unnamed Achievement')
@@ -246,17 +262,25 @@ def seed_achievements(db: Session):
             # Decode the image if it exists
             image_b64 = ach_data.get('image_base64')
             image_bytes = base64.b64decode(image_b64) if image_b64 else None
+            stored_image = store_image(image_bytes) if image_bytes else None
 
             # Create the new Achievement instance
-            new_achievement = Achievement(
+            achievement = Achievement(
                 key=key,
                 category=category,
                 name=name,
                 description=description,
-                image_data=image_bytes
+                **image_columns("image", stored_image)
             )
-            db.add(new_achievement)
+            db.add(achievement)
             print(f"  - Added Achievement: {name}")
+
+        # Attach collection members (also backfills achievements seeded before requirements existed)
+        if ach_data.get('students') and not achievement.required_students:
+            required_students = _resolve_required_students(db, ach_data)
+            if required_students:
+                achievement.required_students = required_students
+                print(f"  - Linked {len(required_students)} required students to {key}")
             
     db.commit()
 
@@ -266,6 +290,8 @@ def main():
     # Create database tables
     print("Initializing database and creating tables...")
     Base.metadata.create_all(bind=engine)
+    for column in add_missing_columns():
+        print(f"  - Added column {column}")
     print("Tables created successfully.")
 
     # Use a session that is automatically closed
@@ -1,8 +1,12 @@
 import logging
+import secrets
+import time
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, APIRouter, Depends, HTTPException, Request, status, Query
 
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 
 from logging.config import dictConfig
 from sqlalchemy.orm import Session, joinedload, selectinload
@@ -13,15 +17,51 @@ from .log import LOGGING_CONFIG
 from .routers import users, banners, images, gacha, dashboard
 from .util.models import School, Student
 from .util.admin import init_admin
+from .util.AchievementEngine import ACHIEVEMENT_REGISTRY
+from .util.achievement_queue import shutdown_achievement_pool
 from .util.cache import get_cache, Cache
-from .util.database import get_db
+from .util.cache_aside import cached
+from .util.database import SessionLocal, add_missing_columns, get_db
+from .util.invalidation import get_invalidation_bus
+from .util.metrics import HTTP_LATENCY, HTTP_REQUESTS, render_metrics
 from .util.schemas.SchoolResponse import SchoolResponse
 from .util.schemas.StudentResponse import StudentResponse
+from .util.warmup import warm_up_cache
 
 # `__name__` will automatically create a logger named "backend.main"
 dictConfig(LOGGING_CONFIG)
 LOGGER = logging.getLogger(__name__)
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Columns added to existing tables since the database was created (e.g. unlock_achievement_table.is_notified)
+    try:
+        for column in add_missing_columns():
+            LOGGER.info(f"Added column {column}")
+    except Exception as e:
+        LOGGER.warning(f"Could not add the missing columns (run `python -m backend_fastapi.create_db`): {e}")
+
+    # Load the achievement definitions once, before the first pull needs them
+    try:
+        with SessionLocal() as db:
+            snapshot = ACHIEVEMENT_REGISTRY.reload(db)
+        LOGGER.info(f"Loaded {len(snapshot.by_key)} achievement definitions ({len(snapshot.collections)} collections).")
+    except Exception as e:
+        LOGGER.warning(f"Could not preload achievement definitions, they will be loaded on first use: {e}")
+
+    # Evict in-process copies when other workers change data
+    get_invalidation_bus().start()
+
+    # Fill the caches before accepting traffic, within CACHE_WARMUP_BUDGET
+    if settings.CACHE_WARMUP:
+        try:
+            await warm_up_cache(app)
+        except Exception as e:
+            LOGGER.warning(f"Cache warm-up failed, caches will fill on demand: {e}")
+    yield
+    shutdown_achievement_pool()
+
+app = FastAPI(lifespan=lifespan)
 api_router = APIRouter()
 
 api_router.include_router(users.router, prefix="/users", tags=["users"])
@@ -39,46 +79,77 @@ init_admin(app)
 origins = ["http://localhost:5173", "http://localhost:5173"]
 app.add_middleware(CORSMiddleware, allow_origins=origins, allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
 
+# --- Metrics ---
+
+def route_template(request: Request) -> str:
+    """`/api/banners/{banner_id}/details/` rather than the concrete path, to keep the label set small."""
+    # Set by the router on the selected route; absent when nothing matched (404)
+    route = request.scope.get("route")
+    if route is None or not hasattr(route, "path_regex"):
+        return "unmatched"
+
+    # Routes of mounts and included routers only know their own part of the path:
+    # the prefix is whatever comes before the part the route matches
+    path = request.scope["path"]
+    for i, char in enumerate(path):
+        if char == "/" and route.path_regex.match(path[i:]):
+            return path[:i] + route.path
+    return route.path
+
+if settings.METRICS_ENABLED:
+    @app.middleware("http")
+    async def record_request_metrics(request: Request, call_next):
+        start = time.perf_counter()
+        status_code = 500
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+            return response
+        finally:
+            route = route_template(request)
+            HTTP_LATENCY.observe(time.perf_counter() - start, request.method, route)
+            HTTP_REQUESTS.inc(request.method, route, str(status_code))
+
+    # Per-route traffic and cache namespaces are not public: only served to a scraper holding METRICS_TOKEN
+    @app.get("/metrics", tags=["metrics"], include_in_schema=False)
+    def get_metrics(request: Request):
+        if not settings.METRICS_TOKEN:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+        authorization = request.headers.get("authorization", "")
+        if not secrets.compare_digest(authorization.encode(), f"Bearer {settings.METRICS_TOKEN}".encode()):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token", headers={"WWW-Authenticate": "Bearer"})
+        return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 # --- API Endpoints for webpage ---
 
 @app.get("/api/schools/", tags=["web"], response_model=list[SchoolResponse])
+@cached("all_schools")
 def get_schools(request: Request, db: Session = Depends(get_db), cache: Cache = Depends(get_cache)):
-    cache_key = "all_schools"
-
-    cached_data = cache.get(cache_key)
-    if cached_data:
-        if settings.DEBUG_MODE:
-            LOGGER.debug(f"CACHE HIT ({cache_key})")
-        return [SchoolResponse.model_validate(item) for item in cached_data]
-    
-    if settings.DEBUG_MODE:
-        LOGGER.debug(f"CACHE MISS ({cache_key})")
     db_schools = db.query(School).all()
     
     response_schools:List[SchoolResponse] = []
     for school in db_schools:
         school_data = SchoolResponse.model_validate(school)
-        if school.image_data:
+        if school.image_sha256:
             school_data.image_url = str(request.url_for('serve_school_image', school_id=school.id))
         response_schools.append(school_data)
 
-    schools_to_cache = [s.model_dump(mode='json') for s in response_schools]
-    cache.set(cache_key, schools_to_cache, expire=settings.CACHE_EXPIRE)
-        
     return response_schools
 
 @app.get("/api/students/", tags=["web"], response_model=list[StudentResponse])
+@cached("all_students:{school_id}:{version_id}")
 def get_students(
         request: Request, 
         school_id: Optional[int] = None,
         version_id: Optional[int] = None,
-        db: Session = Depends(get_db)
+        db: Session = Depends(get_db),
+        cache: Cache = Depends(get_cache)
     ):
     
     # Start with a base query
     students_query = (
         db.query(Student)
-        .options(joinedload(Student.school), joinedload(Student.version), joinedload(Student.asset))
+        .options(joinedload(Student.school), joinedload(Student.version))
     )
     
     # If a school_id was provided in the URL, apply the filter
@@ -97,7 +168,7 @@ def get_students(
 
         # Step 2: Create the school response object, adding the URL
         school_response = SchoolResponse.model_validate(student.school)
-        if student.school.image_data:
+        if student.school.image_sha256:
              school_response.image_url = str(request.url_for('serve_school_image', school_id=student.school.id))
 
         student_response.portrait_url = str(request.url_for('serve_student_image', student_id=student.id, image_type='portrait'))
@@ -0,0 +1,70 @@
+import argparse
+from typing import Dict
+from sqlalchemy import select, update
+from sqlalchemy.orm.session import Session
+
+from .util.database import SessionLocal, add_missing_columns
+from .util.image_store import IMAGE_STORE, image_columns
+from .util.image_variants import store_image
+from .util.models import Achievement, GachaBanner, ImageAsset, School
+
+# (model, legacy BLOB column, prefix of the image store columns)
+IMAGE_COLUMNS = [
+    (School, "image_data", "image"),
+    (GachaBanner, "image_data", "image"),
+    (Achievement, "image_data", "image"),
+    (ImageAsset, "portrait_data", "portrait"),
+    (ImageAsset, "artwork_data", "artwork"),
+]
+
+def migrate_images(db: Session, keep_blobs: bool = False, batch_size: int = 50) -> Dict[str, int]:
+    """
+    Writes every BLOB that has no image store copy yet to the store (with its
+    renditions) and records its hash, size and MIME type. One image is loaded
+    at a time. Unless `keep_blobs`, the BLOB columns are emptied afterwards.
+    """
+    migrated: Dict[str, int] = {}
+    for model, blob_name, prefix in IMAGE_COLUMNS:
+        blob = getattr(model, blob_name)
+        sha256 = getattr(model, f"{prefix}_sha256")
+        label = f"{model.__tablename__}.{blob_name}"
+
+        row_ids = [row_id for (row_id,) in db.execute(select(model.id).where(blob.isnot(None), sha256.is_(None)))]
+        for count, row_id in enumerate(row_ids, start=1):
+            data = db.execute(select(blob).where(model.id == row_id)).scalar()
+            values = image_columns(prefix, store_image(data))
+            if not keep_blobs:
+                values[blob_name] = None
+            db.execute(update(model).where(model.id == row_id).values(**values))
+            if count % batch_size == 0:
+                db.commit()
+                print(f"  - {label}: {count}/{len(row_ids)}")
+
+        # Also empties rows migrated earlier with --keep-blobs
+        if not keep_blobs:
+            db.execute(update(model).where(blob.isnot(None), sha256.isnot(None)).values(**{blob_name: None}))
+        db.commit()
+        migrated[label] = len(row_ids)
+    return migrated
+
+def main():
+    parser = argparse.ArgumentParser(description="Move the image BLOBs out of the database into the content-addressed image store.")
+    parser.add_argument("--keep-blobs", action="store_true", help="Leave the BLOB columns filled (e.g. to roll back).")
+    parser.add_argument("--batch-size", type=int, default=50, help="Images per commit.")
+    args = parser.parse_args()
+
+    # The `*_sha256` / `*_size` / `*_mime` columns of tables created before the image store
+    print("Checking image store columns...")
+    for column in add_missing_columns():
+        print(f"  - Added column {column}")
+
+    print(f"Moving images to {IMAGE_STORE.root.resolve()}...")
+    with SessionLocal() as db:
+        migrated = migrate_images(db, keep_blobs=args.keep_blobs, batch_size=args.batch_size)
+
+    for label, count in migrated.items():
+        print(f"  - {label}: {count} images")
+    print("Done. Flush the Redis cache (or restart the servers when CACHE_TYPE=memory) so cached responses pick up the moved images.")
+
+if __name__ == "__main__":
+    main()
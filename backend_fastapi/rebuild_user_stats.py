@@ -0,0 +1,73 @@
+import argparse
+from typing import Optional
+from sqlalchemy import case, delete, func, insert, select
+from sqlalchemy.orm.session import Session
+
+from .util.database import Base, SessionLocal, engine
+from .util.models import GachaTransaction, Student, UserStats, UserBannerStats
+
+STATS_COLUMNS = ["total_pulls", "r3_count", "r2_count", "r1_count"]
+
+def _count_columns():
+    """Aggregates shared by both statistics tables, computed from the transaction history."""
+    return (
+        func.count(GachaTransaction.id),
+        func.sum(case((Student.rarity == 3, 1), else_=0)),
+        func.sum(case((Student.rarity == 2, 1), else_=0)),
+        func.sum(case((Student.rarity == 1, 1), else_=0)),
+    )
+
+def rebuild_user_stats(db: Session, user_id: Optional[int] = None) -> None:
+    """
+    Recomputes UserStats and UserBannerStats from GachaTransaction with two
+    INSERT ... SELECT statements, for every user or a single one.
+    """
+    user_filter = [GachaTransaction.user_id.isnot(None)]
+    if user_id is not None:
+        user_filter.append(GachaTransaction.user_id == user_id)
+
+    user_select = (
+        select(GachaTransaction.user_id, *_count_columns())
+        .join(Student, Student.id == GachaTransaction.student_id)
+        .where(*user_filter)
+        .group_by(GachaTransaction.user_id)
+    )
+    banner_select = (
+        select(GachaTransaction.user_id, GachaTransaction.banner_id, *_count_columns())
+        .join(Student, Student.id == GachaTransaction.student_id)
+        .where(*user_filter, GachaTransaction.banner_id.isnot(None))
+        .group_by(GachaTransaction.user_id, GachaTransaction.banner_id)
+    )
+
+    delete_stats = delete(UserStats)
+    delete_banner_stats = delete(UserBannerStats)
+    if user_id is not None:
+        delete_stats = delete_stats.where(UserStats.user_id == user_id)
+        delete_banner_stats = delete_banner_stats.where(UserBannerStats.user_id == user_id)
+
+    db.execute(delete_stats)
+    db.execute(delete_banner_stats)
+    db.execute(insert(UserStats).from_select(["user_id", *STATS_COLUMNS], user_select))
+    db.execute(insert(UserBannerStats).from_select(["user_id", "banner_id", *STATS_COLUMNS], banner_select))
+    db.commit()
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the materialized user pull statistics from the transaction history.")
+    parser.add_argument("--user-id", type=int, default=None, help="Only rebuild the statistics of this user.")
+    args = parser.parse_args()
+
+    # Make sure the statistics tables exist on databases created before they were added
+    Base.metadata.create_all(bind=engine, tables=[UserStats.__table__, UserBannerStats.__table__])
+
+    target = f"user {args.user_id}" if args.user_id is not None else "all users"
+    print(f"Rebuilding pull statistics for {target}...")
+
+    with SessionLocal() as db:
+        rebuild_user_stats(db, args.user_id)
+        user_count = db.query(func.count(UserStats.id)).scalar()
+        banner_count = db.query(func.count(UserBannerStats.id)).scalar()
+
+    print(f"Done. {user_count} user rows and {banner_count} user-banner rows in the statistics tables.")
+
+if __name__ == "__main__":
+    main()
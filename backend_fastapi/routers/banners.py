@@ -3,8 +3,8 @@ from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session, joinedload, selectinload
 from typing import List
 
-from ..config import settings
 from ..util.cache import get_cache, Cache
+from ..util.cache_aside import cached
 from ..util.database import get_db
 from ..util.models import GachaBanner, Student
 from ..util.schemas.BannerResponse import BannerResponse, BannerDetailResponse
@@ -14,38 +14,24 @@ LOGGER = logging.getLogger(__name__)
 router = APIRouter()
 
 @router.get("/", response_model=List[BannerResponse])
+@cached("all_banners")
 def get_banners(request: Request, db: Session = Depends(get_db), cache: Cache = Depends(get_cache)):
-    cache_key = "all_banners"
-
-    # Get all banner data from cache
-    cached_data = cache.get(cache_key)
-    if cached_data:
-        # Convert from dict to pydatic schema
-        if settings.DEBUG_MODE:
-            LOGGER.debug(f"CACHE HIT ({cache_key})")
-        return [BannerResponse.model_validate(item) for item in cached_data]
-
     # Get all banner data from db
-    if settings.DEBUG_MODE:
-        LOGGER.debug(f"CACHE MISS ({cache_key})")
     banner_list = db.query(GachaBanner).all()
 
     # Prepare response data following pydatic schema
     response_banners:List[BannerResponse] = []
     for banner in banner_list:
         banner_data = BannerResponse.model_validate(banner)
-        if banner.image_data:
+        if banner.image_sha256:
             banner_data.image_url = str(request.url_for('serve_banner_image', banner_id=banner.id))
         response_banners.append(banner_data)
 
-    # Convert format to dict for saving cache
-    banners_to_cache = [b.model_dump(mode='json') for b in response_banners]
-    cache.set(cache_key, banners_to_cache, expire=settings.CACHE_EXPIRE)
-        
     return response_banners
 
 @router.get("/{banner_id}/details/", response_model=BannerDetailResponse)
-def get_banner_details(banner_id: int, request: Request, db: Session = Depends(get_db)):
+@cached("banner:{banner_id}")
+def get_banner_details(banner_id: int, request: Request, db: Session = Depends(get_db), cache: Cache = Depends(get_cache)):
 
     # Check banner is exist    
     db_banner = db.query(GachaBanner).options(
@@ -67,8 +53,7 @@ def get_banner_details(banner_id: int, request: Request, db: Session = Depends(g
     # Query only students available in banner from all students
     all_students_obj = db.query(Student).options(
         joinedload(Student.school), 
-        joinedload(Student.version), 
-        joinedload(Student.asset)
+        joinedload(Student.version)
     ).filter(
         Student.version_id.in_(included_version_ids),
         Student.id.not_in(excluded_ids),
@@ -76,7 +61,7 @@ def get_banner_details(banner_id: int, request: Request, db: Session = Depends(g
     
     # Prepare response following schema
     base_banner_response = BannerResponse.model_validate(db_banner)
-    if db_banner.image_data:
+    if db_banner.image_sha256:
         base_banner_response.image_url = str(request.url_for('serve_banner_image', banner_id=db_banner.id)) 
 
     # StudentResponse
@@ -2,16 +2,15 @@ import logging
 import math
 import statistics
 
-from collections import Counter, defaultdict
 from fastapi import APIRouter, Depends, Request, Query
 from sqlalchemy import func, case
 from sqlalchemy.orm import Session, joinedload
 from typing import List, Optional
 
-from ..config import settings
 from ..util.auth import get_required_current_user
-from ..util.models import GachaBanner, GachaTransaction, User, Achievement, UserInventory, Student, GachaPreset, UnlockAchievement
+from ..util.models import GachaBanner, GachaTransaction, User, Achievement, UserInventory, Student, GachaPreset, UnlockAchievement, UserStats, UserBannerStats
 from ..util.cache import get_cache, Cache
+from ..util.cache_aside import cached
 from ..util.database import get_db
 from ..util.schemas.StudentResponse import create_student_response
 from ..util.schemas.BannerResponse import BannerResponse
@@ -19,6 +18,7 @@ from ..util.schemas.DashboardResponse import KpiResponse, LuckGapsSchema, Overal
 from ..util.schemas.HistoryResponse import HistoryResponse, TransactionSchema
 from ..util.schemas.CollectionResponse import CollectionResponse, CollectionStudentSchema
 from ..util.schemas.AchievementResponse import UserAchievementResponse, AchievementResponse
+from ..util.achievement_queue import pop_pending_achievements
 
 LOGGER = logging.getLogger(__name__)
 
@@ -27,32 +27,27 @@ router = APIRouter()
 # --- API Endpoints ---
 
 @router.get("/summary/kpis", response_model=KpiResponse)
+@cached("kpis", namespace="dashboard", per_user=True)
 def get_dashboard_kpis(
     current_user: User = Depends(get_required_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    cache: Cache = Depends(get_cache)
 ):
-    # --- PERFORMANCE IMPROVEMENT: Fetch all rarities in a single, efficient query ---
-    rarity_pulls = db.query(Student.rarity).join(
-        GachaTransaction, GachaTransaction.student_id == Student.id
-    ).filter(
-        GachaTransaction.user_id == current_user.id
-    ).all()
-
-    # The result is a list of tuples, e.g., [(3,), (2,), (2,)].
-    # We use a Counter to efficiently count them.
-    rarity_counter = Counter(r[0] for r in rarity_pulls)
-    total_pulls = len(rarity_pulls)
+    # Read the materialized counters (one row per user) instead of scanning the pull history
+    stats = db.query(UserStats).filter_by(user_id=current_user.id).first()
+    total_pulls = stats.total_pulls if stats else 0
 
     # Return an instance of the Pydantic schema
     return KpiResponse(
         total_pulls=total_pulls,
         total_pyroxene_spent=total_pulls * 120,
-        r3_count=rarity_counter.get(3, 0),
-        r2_count=rarity_counter.get(2, 0),
-        r1_count=rarity_counter.get(1, 0),
+        r3_count=stats.r3_count if stats else 0,
+        r2_count=stats.r2_count if stats else 0,
+        r1_count=stats.r1_count if stats else 0,
     )
 
 @router.get("/summary/top-students/{rarity}", response_model=List[Top3StudentResponse])
+@cached("top_students:{rarity}", namespace="dashboard", per_user=True)
 def get_top_students_by_rarity(
     rarity: int,
     request: Request, # Add Request to build image URLs
@@ -60,21 +55,7 @@ def get_top_students_by_rarity(
     db: Session = Depends(get_db), 
     cache: Cache = Depends(get_cache)
 ):
-    
-    cache_key = f"dashboard:top_students:{current_user.id}:{rarity}"
-
-    # 3. Try to get the data from the cache first
-    cached_data = cache.get(cache_key)
-    if cached_data:
-        if settings.DEBUG_MODE:
-            LOGGER.debug(f"CACHE HIT for {cache_key}")
-        # The data in the cache is already a JSON-serializable list of dicts.
-        # FastAPI will automatically validate it against the response_model.
-        return cached_data
-    
-    if settings.DEBUG_MODE:
-        LOGGER.debug(f"CACHE MISS for {cache_key}")
-    
+
      # --- START OF THE NEW, EFFICIENT QUERY ---
 
     # Step 1: Create a subquery that works ONLY on the GachaTransaction table.
@@ -126,9 +107,6 @@ def get_top_students_by_rarity(
             first_obtained=first_obtained
         )
         response_data.append(entry)
-
-    data_to_cache = [entry.model_dump(mode="json") for entry in response_data]
-    cache.set(cache_key, data_to_cache, expire=settings.CACHE_EXPIRE) # Cache for 1 hour
         
     return response_data
 
@@ -136,6 +114,7 @@ def get_top_students_by_rarity(
     "/summary/first-r3-pull", 
     response_model=Optional[FirstR3Response] # The response can be null
 )
+@cached("first_r3_pull", namespace="dashboard", per_user=True)
 def get_first_r3_pull(
     request: Request,
     current_user: User = Depends(get_required_current_user),
@@ -145,19 +124,6 @@ def get_first_r3_pull(
     """
     Finds the user's first-ever 3-star pull transaction.
     """
-    cache_key = f"dashboard:first_r3_pull:{current_user.id}"
-    
-    cached_data = cache.get(cache_key)
-    if cached_data:
-
-        if settings.DEBUG_MODE:
-            LOGGER.debug(f"CACHE HIT for {cache_key}")
-        # The special value "NONE" indicates a cached "not found" result
-        return None if cached_data == "NONE" else cached_data
-
-    if settings.DEBUG_MODE:
-        LOGGER.debug(f"CACHE MISS for {cache_key}")
-
     first_r3_pull_orm = (
         db.query(GachaTransaction)
         .join(Student)
@@ -170,8 +136,7 @@ def get_first_r3_pull(
     )
 
     if not first_r3_pull_orm:
-        # Cache the "not found" result for 1 hour to prevent re-querying
-        cache.set(cache_key, "NONE", expire=settings.CACHE_EXPIRE)
+        # Cached as null like any other result, so it is not re-queried
         return None
 
     # Build the Pydantic response object
@@ -180,9 +145,6 @@ def get_first_r3_pull(
         student=student_response,
         first_obtain_on=first_r3_pull_orm.create_on,
     )
-    
-    # Cache the successful result
-    cache.set(cache_key, response_data.model_dump(mode="json"), expire=settings.CACHE_EXPIRE) # Cache forever
 
     return response_data
 
@@ -190,71 +152,43 @@ def get_first_r3_pull(
     "/summary/chart-banner-breakdown",
     response_model=DistributionResponse
 )
+@cached("chart_banner_breakdown", namespace="dashboard", per_user=True)
 def get_chart_banner_breakdown(
     current_user: User = Depends(get_required_current_user),
     db: Session = Depends(get_db),
     cache: Cache = Depends(get_cache)
 ):
-    cache_key = f"dashboard:chart_banner_breakdown:{current_user.id}"
-    cached_data = cache.get(cache_key)
-    if cached_data:
-        if settings.DEBUG_MODE:
-            LOGGER.debug(f"CACHE HIT for {cache_key}")
-        return cached_data
-
-    if settings.DEBUG_MODE:
-        LOGGER.debug(f"CACHE MISS for {cache_key}")
-    
-    # Efficiently fetch all pulls with banner name and student rarity
-    pulls = db.query(
+    # Read the materialized per-banner counters (one row per banner the user pulled on)
+    banner_stats = db.query(
         GachaBanner.name,
-        Student.rarity
+        UserBannerStats.r3_count,
+        UserBannerStats.r2_count,
+        UserBannerStats.r1_count
     ).join(
-        GachaTransaction, GachaTransaction.banner_id == GachaBanner.id
-    ).join(
-        Student, GachaTransaction.student_id == Student.id
-    ).filter(GachaTransaction.user_id == current_user.id)
+        UserBannerStats, UserBannerStats.banner_id == GachaBanner.id
+    ).filter(UserBannerStats.user_id == current_user.id)
 
-    # Process in Python for speed
-    pulls_by_banner = defaultdict(Counter)
-    for banner_name, rarity in pulls:
-        pulls_by_banner[banner_name][rarity] += 1
-    
     response_data = {}
-    for banner_name, rarity_counter in pulls_by_banner.items():
+    for banner_name, r3_count, r2_count, r1_count in banner_stats:
         response_data[banner_name] = OverallRaritySchema(
-            r3_count=rarity_counter.get(3, 0),
-            r2_count=rarity_counter.get(2, 0),
-            r1_count=rarity_counter.get(1, 0),
+            r3_count=r3_count,
+            r2_count=r2_count,
+            r1_count=r1_count,
         )
     
-    final_response = DistributionResponse(data=response_data)
-    cache.set(cache_key, final_response.model_dump(mode='json'), expire=settings.CACHE_EXPIRE)
-    return final_response
+    return DistributionResponse(data=response_data)
 
 @router.get(
     "/summary/milestone-timeline",
     response_model=List[MilestoneResponse]
 )
+@cached("milestones", namespace="dashboard", per_user=True)
 def get_milestone_timeline(
     request: Request,
     current_user: User = Depends(get_required_current_user),
     db: Session = Depends(get_db),
     cache: Cache = Depends(get_cache)
 ):
-    cache_key = f"dashboard:milestones:{current_user.id}"
-    cached_data = cache.get(cache_key)
-    if cached_data is not None: # More robust check for any cached data
-        
-        if settings.DEBUG_MODE:
-            LOGGER.debug(f"CACHE HIT for {cache_key}")
-        # If the cached value is our special string, return an empty list.
-        # Otherwise, return the cached data itself.
-        return [] if cached_data == "NONE" else cached_data
-    
-    if settings.DEBUG_MODE:
-        LOGGER.debug(f"CACHE MISS for {cache_key}")
-    
     # --- START OF THE NEW, EFFICIENT QUERY ---
 
     # Step 1: Create a subquery (like a temporary virtual table) that numbers
@@ -289,7 +223,6 @@ def get_milestone_timeline(
     )
 
     if not milestone_query_results:
-        cache.set(cache_key, "NONE", expire=settings.CACHE_EXPIRE)
         return []
     
     # Step 3: Now that we have the small list of milestone student IDs, fetch their
@@ -313,9 +246,6 @@ def get_milestone_timeline(
                 pull_number=pull_number
             )
             milestone_pulls.append(milestone_entry)
-    
-    data_to_cache = [entry.model_dump(mode="json") for entry in milestone_pulls]
-    cache.set(cache_key, data_to_cache, expire=settings.CACHE_EXPIRE)
 
     return milestone_pulls
 
@@ -323,21 +253,12 @@ def get_milestone_timeline(
     "/summary/performance-table",
     response_model=List[LuckPerformanceResponse]
 )
+@cached("performance_table", namespace="dashboard", per_user=True)
 def get_performance_table(
     current_user: User = Depends(get_required_current_user),
     db: Session = Depends(get_db),
     cache: Cache = Depends(get_cache)
 ):
-    cache_key = f"dashboard:performance_table:{current_user.id}"
-    cached_data = cache.get(cache_key)
-    if cached_data:
-        if settings.DEBUG_MODE:
-            LOGGER.debug(f"CACHE HIT for {cache_key}")
-        return cached_data
-
-    if settings.DEBUG_MODE:
-        LOGGER.debug(f"CACHE MISS for {cache_key}")
-
     # 1. Perform an efficient aggregation query to get stats for ALL banners at once.
     banner_stats_query = (
         db.query(
@@ -411,9 +332,6 @@ def get_performance_table(
             gaps=gaps_data
         )
         banner_analysis.append(analysis_entry)
-
-    data_to_cache = [entry.model_dump() for entry in banner_analysis]
-    cache.set(cache_key, data_to_cache, expire=settings.CACHE_EXPIRE)
     
     return banner_analysis
 
@@ -421,22 +339,12 @@ def get_performance_table(
     "/summary/collection",
     response_model=SummaryCollectionResponse
 )
+@cached("collection_summary", namespace="dashboard", per_user=True)
 def get_collection_progression(
     current_user: User = Depends(get_required_current_user),
     db: Session = Depends(get_db),
     cache: Cache = Depends(get_cache)
 ):
-    cache_key = f"dashboard:collection_summary:{current_user.id}"
-    cached_data = cache.get(cache_key)
-    if cached_data:
-        
-        if settings.DEBUG_MODE:
-            LOGGER.debug(f"CACHE HIT for {cache_key}")
-        return cached_data
-
-    if settings.DEBUG_MODE:
-        LOGGER.debug(f"CACHE MISS for {cache_key}")
-
     # 1. Fetch total counts
     total_counts_query = db.query(Student.rarity, func.count(Student.id)).group_by(Student.rarity).all()
     total_map = {str(rarity): count for rarity, count in total_counts_query}
@@ -461,18 +369,17 @@ def get_collection_progression(
             total=total_map.get(rarity, 0)
         )
     
-    final_response = SummaryCollectionResponse(data=response_data)
-    cache.set(cache_key, final_response.model_dump(mode='json'), expire=settings.CACHE_EXPIRE)
-
-    return final_response
+    return SummaryCollectionResponse(data=response_data)
 
 @router.get("/history", response_model=HistoryResponse)
+@cached("history:{page}:{limit}", namespace="dashboard", per_user=True)
 def get_user_history(
     request: Request,
     page: int = Query(1, ge=1, description="Page number"),
     limit: int = Query(5, ge=1, le=100, description="Items per page"),
     current_user: User = Depends(get_required_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    cache: Cache = Depends(get_cache)
 ):
     # 1. First, get the total count of transactions for this user (fast query)
     total_items_query = db.query(func.count(GachaTransaction.id)).filter(
@@ -504,7 +411,7 @@ def get_user_history(
     for tx in history_items_orm:
         student_resp = create_student_response(tx.student, request)
         banner_resp = BannerResponse.model_validate(tx.banner)
-        banner_resp.image_url = str(request.url_for('serve_banner_image', banner_id=tx.banner.id)) if tx.banner.image_data else None
+        banner_resp.image_url = str(request.url_for('serve_banner_image', banner_id=tx.banner.id)) if tx.banner.image_sha256 else None
         
         history_items_response.append(TransactionSchema(
             id=tx.id,
@@ -523,23 +430,13 @@ def get_user_history(
     )
 
 @router.get("/collection", response_model=CollectionResponse)
+@cached("collection", ttl=3600, namespace="dashboard", per_user=True)
 def get_user_collection(
     request: Request,
     current_user: User = Depends(get_required_current_user),
     db: Session = Depends(get_db),
     cache: Cache = Depends(get_cache)
 ):
-    cache_key = f"dashboard:collection:{current_user.id}"
-    cached_data = cache.get(cache_key)
-    if cached_data:
-        
-        if settings.DEBUG_MODE:
-            LOGGER.debug(f"CACHE HIT for {cache_key}")
-        return cached_data
-
-    if settings.DEBUG_MODE:
-        LOGGER.debug(f"CACHE MISS for {cache_key}")
-
     # --- START OF THE NEW, EFFICIENT QUERY ---
 
     # Step 1: Create a subquery containing ONLY the student IDs this user owns.
@@ -564,22 +461,21 @@ def get_user_collection(
         )
         .options(
             joinedload(Student.school),
-            joinedload(Student.version),
-            joinedload(Student.asset) # Good practice to be explicit
+            joinedload(Student.version)
         )
         .order_by(Student.rarity.desc(), Student.name.asc())
         .all()
     )
 
     # --- END OF THE NEW QUERY ---
-    
+
     # 3. Process the results. The result is a list of tuples: (Student, is_obtained_boolean)
     collection_students: List[CollectionStudentSchema] = []
     obtained_count = 0
     for student_orm, is_obtained in all_students_with_status:
         if is_obtained:
             obtained_count += 1
-            
+        
         student_response = create_student_response(student_orm, request)
         collection_student = CollectionStudentSchema(
             **student_response.model_dump(),
@@ -597,28 +493,17 @@ def get_user_collection(
         completion_percentage=round(completion_percentage, 2),
         students=collection_students
     )
-    
-    # Cache the result
-    cache.set(cache_key, response_data.model_dump(mode="json"), expire=3600)
+
     return response_data
 
 @router.get("/achievements", response_model=List[UserAchievementResponse])
+@cached("achievements", ttl=3600, namespace="dashboard", per_user=True)
 def get_user_achievements(
     request: Request,
     current_user: User = Depends(get_required_current_user),
     db: Session = Depends(get_db),
     cache: Cache = Depends(get_cache)
 ):
-    cache_key = f"dashboard:achievements:{current_user.id}"
-    cached_data = cache.get(cache_key)
-    if cached_data:
-        if settings.DEBUG_MODE:
-            LOGGER.debug(f"CACHE HIT for {cache_key}")
-        return cached_data
-    
-    if settings.DEBUG_MODE:
-        LOGGER.debug(f"CACHE MISS for {cache_key}")
-
     # Use a LEFT JOIN to fetch all achievements and augment them with unlock data
     # for the current user in a single, efficient query.
     achievements_with_status = (
@@ -639,7 +524,7 @@ def get_user_achievements(
     response_data = []
     for ach_orm, unlock_on in achievements_with_status:
         achievement_data = AchievementResponse.model_validate(ach_orm)
-        achievement_data.image_url = str(request.url_for('serve_achievement_image', achievement_id=ach_orm.id)) if ach_orm.image_data else None
+        achievement_data.image_url = str(request.url_for('serve_achievement_image', achievement_id=ach_orm.id)) if ach_orm.image_sha256 else None
         
         response_data.append(UserAchievementResponse(
             **achievement_data.model_dump(),
@@ -647,6 +532,26 @@ def get_user_achievements(
             unlocked_on=unlock_on
         ))
 
-    # Cache the result. This should be invalidated when a new achievement is unlocked.
-    cache.set(cache_key, [item.model_dump(mode="json") for item in response_data], expire=3600)
+    # Cached per user generation, so a new unlock (which bumps it) is visible right away
+    return response_data
+
+@router.get("/achievements/pending", response_model=List[AchievementResponse])
+def get_pending_achievements(
+    request: Request,
+    current_user: User = Depends(get_required_current_user),
+    db: Session = Depends(get_db),
+):
+    """
+    Achievements unlocked in the background (ACHIEVEMENT_MODE=async) that the
+    user has not been shown yet. Each unlock is returned once. Never cached.
+    """
+    pending = pop_pending_achievements(db, current_user.id)
+    db.commit()
+
+    response_data = []
+    for ach in pending:
+        achievement_data = AchievementResponse.model_validate(ach)
+        achievement_data.image_url = str(request.url_for('serve_achievement_image', achievement_id=ach.id)) if ach.has_image else None
+        response_data.append(achievement_data)
+
     return response_data
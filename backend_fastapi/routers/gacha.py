@@ -1,20 +1,23 @@
 import logging
-from fastapi import APIRouter, Depends, HTTPException, Request
-from sqlalchemy import func
+from collections import Counter
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Set, Tuple
 
 from ..config import settings
 from ..util.auth import get_optional_current_user
-from ..util.cache import get_cache, Cache
+from ..util.cache import bump_user_generation, get_cache, Cache
 from ..util.database import get_db
-from ..util.models import GachaBanner, GachaTransaction, User, Achievement, UserInventory, Student
+from ..util.models import GachaTransaction, User, UserInventory, UserStats, UserBannerStats
 from ..util.schemas.AchievementResponse import AchievementResponse
-from ..util.schemas.BannerResponse import BannerCacheSchema
-from ..util.schemas.GachaResponse import GachaPullResponse, GachaStudentSchema
-from ..util.schemas.StudentResponse import create_student_response
-from ..util.AchievementEngine import AchievementEngine
-from ..util.GachaEngine import GachaEngine
+from ..util.schemas.GachaResponse import GachaBatchResponse, GachaBatchStudentSchema, GachaPullResponse, GachaStudentSchema
+from ..util.schemas.StudentResponse import StudentResponse
+from ..util.AchievementEngine import AchievementDefinition, AchievementEngine
+from ..util.achievement_queue import is_async_mode, pop_pending_achievements, submit_pull_achievements
+from ..util.GachaEngine import CompiledBanner, GachaEngine, StudentEntry
+from ..util.timing import PhaseTimer
+from ..util.upsert import upsert_increment
 
 LOGGER = logging.getLogger(__name__)
 
@@ -22,117 +25,231 @@ router = APIRouter()
 
 # --- Helper Functions ---
 
-def _serialize_gacha_student(student_list: List[Student], banner: GachaBanner, request: Request) -> List[GachaStudentSchema]:
-    pickup_ids = [s.id for s in banner.pickup_students]
-
+def _create_entry_response(entry: StudentEntry, request: Request) -> StudentResponse:
+    """Adds the request-dependent image URLs to a precompiled student snapshot."""
+    update = {}
+    if entry.school_has_image:
+        school_url = str(request.url_for('serve_school_image', school_id=entry.response.school.id))
+        update["school"] = entry.response.school.model_copy(update={"image_url": school_url})
+    if entry.has_asset:
+        update["portrait_url"] = str(request.url_for('serve_student_image', student_id=entry.id, image_type='portrait'))
+        update["artwork_url"] = str(request.url_for('serve_student_image', student_id=entry.id, image_type='artwork'))
+    return entry.response.model_copy(update=update)
+
+def _serialize_gacha_student(student_list: List[StudentEntry], sampler: CompiledBanner, request: Request) -> List[GachaStudentSchema]:
     results = []
-    for student in student_list:
-        student_response = create_student_response(student, request)
+    for entry in student_list:
         result_student = GachaStudentSchema(
-            student=student_response,
-            is_pickup=student.id in pickup_ids,
+            student=_create_entry_response(entry, request),
+            is_pickup=entry.id in sampler.pickup_ids,
             is_new=False
         )
         results.append(result_student)
 
     return results
 
+def _max_r3_per_pull(rarities: List[int]) -> int:
+    """Number of 3-stars in the luckiest 10-pull (or single pull) of a result list."""
+    return max(
+        (rarities[i:i + 10].count(3) for i in range(0, len(rarities), 10)),
+        default=0
+    )
+
+def _create_achievement_responses(achievement_list: List[AchievementDefinition], request: Request) -> List[AchievementResponse]:
+    achievements_response: List[AchievementResponse] = []
+    for ach in achievement_list:
+        
+        # Convert schema
+        ach_resp = AchievementResponse.model_validate(ach)
+        ach_resp.image_url = str(request.url_for('serve_achievement_image', achievement_id=ach.id)) if ach.has_image else None
+        achievements_response.append(ach_resp)
+
+    return achievements_response
+
 def _check_achievement(
-    result_schema: List[GachaStudentSchema],
+    rarities: List[int],
+    total_pull_count: int,
+    new_student_ids: Set[int],
     request: Request,
     db: Session, 
     current_user: User, 
 ) -> List[AchievementResponse]:
-    # Get the user's total pull count *before* this pull for milestone checks.
-    initial_pull_count = db.query(func.count(GachaTransaction.id)).filter_by(user_id=current_user.id).scalar() or 0
-
     # Get number of current pull
-    amount = len(result_schema)
+    amount = len(rarities)
+
+    # `total_pull_count` already includes this pull (read from UserStats), so subtract it for the count *before* this pull.
+    initial_pull_count = max(total_pull_count - amount, 0)
     
     # Instantiate the achievement engine. It loads the user's existing unlocks.
     ach_engine = AchievementEngine(user=current_user, db=db)
 
     # Check achievement (Raw data)
-    achievement_list: List[Achievement] = []
-    achievement_list.extend(ach_engine.check_luck_achievements(result_schema))
-    achievement_list.extend(ach_engine.check_milestone_achievements(initial_pull_count, amount))
-    achievement_list.extend(ach_engine.check_collection_achievements())
+    achievement_list = ach_engine.check_pull_achievements(
+        _max_r3_per_pull(rarities), initial_pull_count, amount, new_student_ids
+    )
 
-    # Convert raw data to schema and save database
-    achievements_response: List[AchievementResponse] = []
-    for ach in achievement_list:
-        
-        # Convert schema
-        ach_resp = AchievementResponse.model_validate(ach)
-        ach_resp.image_url = str(request.url_for('serve_achievement_image', achievement_id=ach.id)) if ach.image_data else None
-        achievements_response.append(ach_resp)
-        
-        # Preparing save database
-        db.add(ach)
+    # The new unlocks are only added to the session; the caller commits them with the pull.
+    return _create_achievement_responses(achievement_list, request)
+
+def _queue_achievement_check(
+    rarities: List[int],
+    total_pull_count: int,
+    new_student_ids: Set[int],
+    current_user: User,
+) -> bool:
+    """Hands the achievement check of a committed pull to the background workers."""
+    amount = len(rarities)
+    return submit_pull_achievements(
+        current_user.id, _max_r3_per_pull(rarities), max(total_pull_count - amount, 0), amount, new_student_ids
+    )
 
-    # Save database
-    db.commit()
+def _upsert_inventory(
+    pulled_counts: Counter,
+    db: Session,
+    current_user: User,
+) -> Set[int]:
+    """
+    Adds the pulled counts to the user's inventory with one atomic upsert, so
+    concurrent pulls by the same user cannot collide on `_user_student_uc`.
+    Returns the ids whose inventory row was created by this call.
+    """
+    rows = [
+        {"user_id": current_user.id, "student_id": sid, "num_obtained": pulled}
+        for sid, pulled in sorted(pulled_counts.items()) # Same lock order in every pull
+    ]
+    result_rows = upsert_increment(
+        db, UserInventory.__table__,
+        conflict_columns=["user_id", "student_id"],
+        rows=rows,
+        increment_columns=["num_obtained"],
+        returning=["student_id", "num_obtained"],
+    )
+    if result_rows is None:
+        result_rows = db.query(UserInventory.student_id, UserInventory.num_obtained).filter(
+            UserInventory.user_id == current_user.id,
+            UserInventory.student_id.in_(list(pulled_counts))
+        ).all()
 
-    return achievements_response
+    # A row holding exactly what this pull added did not exist before it
+    return {sid for sid, num_obtained in result_rows if num_obtained == pulled_counts[sid]}
 
-def _insert_transaction(
-    pulled_results: List[GachaStudentSchema],
-    banner: GachaBanner,
-    db: Session, 
-    current_user: User, 
-    cache: Cache
-) -> None:
-
-    # Pre-fetch the user's existing inventory for the pulled students to check for "new".
-    pulled_student_ids = [result.student.id for result in pulled_results]
-    user_inventory_query = db.query(UserInventory).filter(
-        UserInventory.user_id == current_user.id,
-        UserInventory.student_id.in_(pulled_student_ids)
+def _update_user_stats(
+    rarities: List[int],
+    banner_id: int,
+    db: Session,
+    current_user: User,
+) -> int:
+    """
+    Adds this pull to the materialized per-user and per-banner statistics.
+    Returns the user's total pull count including this pull.
+    """
+    rarity_counter = Counter(rarities)
+    row = {
+        "user_id": current_user.id,
+        "total_pulls": len(rarities),
+        "r3_count": rarity_counter.get(3, 0),
+        "r2_count": rarity_counter.get(2, 0),
+        "r1_count": rarity_counter.get(1, 0),
+    }
+    increment_columns = ["total_pulls", "r3_count", "r2_count", "r1_count"]
+
+    upsert_increment(
+        db, UserBannerStats.__table__,
+        conflict_columns=["user_id", "banner_id"],
+        rows=[{**row, "banner_id": banner_id}],
+        increment_columns=increment_columns,
+    )
+    result_rows = upsert_increment(
+        db, UserStats.__table__,
+        conflict_columns=["user_id"],
+        rows=[row],
+        increment_columns=increment_columns,
+        returning=["total_pulls"],
     )
+    if result_rows is None:
+        return db.query(UserStats.total_pulls).filter_by(user_id=current_user.id).scalar()
+    return result_rows[0][0]
 
-    # Create a dictionary for fast lookups: {student_id: UserInventory_obj}
-    inventory_map = {item.student_id: item for item in user_inventory_query}
+def _bulk_insert_pulls(
+    student_ids: List[int],
+    banner_id: int,
+    db: Session,
+    current_user: User,
+) -> Set[int]:
+    """
+    Writes every transaction with one multi-row insert and the aggregated
+    inventory deltas with one upsert. Does not commit. Returns the ids new to the user.
+    """
+    db.execute(
+        insert(GachaTransaction),
+        [{"user_id": current_user.id, "banner_id": banner_id, "student_id": sid} for sid in student_ids]
+    )
+    return _upsert_inventory(Counter(student_ids), db, current_user)
 
-    # Process pull result for labeling "new" or "pickup"
-    for result in pulled_results:
-        student = result.student
+def _persist_pull(
+    student_ids: List[int],
+    rarities: List[int],
+    banner_id: int,
+    request: Request,
+    db: Session,
+    current_user: User,
+    cache: Cache,
+    timer: PhaseTimer,
+) -> Tuple[Set[int], List[AchievementResponse]]:
+    """
+    Saves a user pull as a single unit of work: transactions, inventory, user
+    statistics and achievement unlocks are committed together, once. The dashboard cache is
+    only invalidated after the commit so no request can re-cache pre-pull data.
+    With ACHIEVEMENT_MODE=async the achievement check is queued after the commit
+    instead, and the response carries the unlocks earlier checks found.
+    Returns the ids new to the user and the unlocked achievements.
+    """
+    with timer.phase("write"):
+        new_ids = _bulk_insert_pulls(student_ids, banner_id, db, current_user)
+        total_pull_count = _update_user_stats(rarities, banner_id, db, current_user)
+
+    with timer.phase("achievements"):
+        if is_async_mode():
+            # This pull is checked in the background after the commit; deliver what earlier checks unlocked.
+            unlocked_achievements = _create_achievement_responses(pop_pending_achievements(db, current_user.id), request)
+        else:
+            unlocked_achievements = _check_achievement(rarities, total_pull_count, new_ids, request, db, current_user)
 
-        # Create a transaction record for each pulled student.
-        new_transaction = GachaTransaction(
-            user_id=current_user.id,
-            banner_id=banner.id,
-            student_id=student.id
-        )
-        db.add(new_transaction)
+    with timer.phase("commit"):
+        db.commit()
 
-        # Update is_new value for GachaStudentSchema in user mode
-        result.is_new = student.id not in inventory_map
+    if is_async_mode():
+        with timer.phase("queue"):
+            queued = _queue_achievement_check(rarities, total_pull_count, new_ids, current_user)
 
-        # Update or create the inventory entry.
-        inventory_item = inventory_map.get(student.id)
-        if inventory_item:
-            inventory_item.num_obtained += 1
-        else:
-            new_inventory_item = UserInventory(
-                user_id=current_user.id,
-                student_id=student.id,
-                num_obtained=1
-            )
-            db.add(new_inventory_item)
-            inventory_map[student.id] = new_inventory_item
+        # Queue full: fall back to checking now, in a second transaction
+        if not queued:
+            with timer.phase("achievements"):
+                unlocked_achievements.extend(_check_achievement(rarities, total_pull_count, new_ids, request, db, current_user))
+                db.commit()
 
-    # Commit database
-    db.commit()
+    with timer.phase("cache"):
+        bump_user_generation(cache, current_user.id)
 
-    # Clear dashboard cache for this user
-    cache_pattern = f"dashboard:*:{current_user.id}*"
-    cache.delete_by_pattern(cache_pattern)
+    if settings.DEBUG_MODE:
+        LOGGER.debug(f"Pull by '{current_user.username}' x{len(student_ids)}: {timer}")
+
+    return new_ids, unlocked_achievements
+
+def _mark_new_students(pulled_results: List[GachaStudentSchema], new_ids: Set[int]) -> None:
+    """A student pulled twice in the same 10-pull is only "new" the first time."""
+    seen_ids: Set[int] = set()
+    for result in pulled_results:
+        student_id = result.student.id
+        result.is_new = student_id in new_ids and student_id not in seen_ids
+        seen_ids.add(student_id)
 
 def _perform_pull(
         banner_id: int,
         amount: int,
         db: Session,
         request: Request,
+        response: Response,
         current_user: User | None,
         cache: Cache
     ) -> GachaPullResponse:
@@ -140,42 +257,27 @@ def _perform_pull(
     Internal function that uses the GachaEngine and conditionally saves
     transactions based on whether a user is present.
     """
+    timer = PhaseTimer()
 
-    cache_key = f"gacha:banner:{banner_id}"
-    banner_data = cache.get(cache_key)
-
-    if banner_data:
-        if settings.DEBUG_MODE:
-            LOGGER.debug(f"Banner '{banner_id}' hit cache.")
-        # Deserialize JSON back into the Pydantic Schema
-        banner = BannerCacheSchema.model_validate(banner_data)
-
-    else:
-        if settings.DEBUG_MODE:
-            LOGGER.debug(f"Banner '{banner_id}' missed cache. Fetching from DB.")
-        banner_db = db.query(GachaBanner).filter_by(id=banner_id).first()
-
-        if not banner_db:
+    with timer.phase("draw"):
+        # Precompiled sampler from the process-wide registry (DB is only hit on a catalog change)
+        engine = GachaEngine.for_banner(banner_id, db)
+        if engine is None:
             raise HTTPException(status_code=404, detail="Banner not found")
 
-        # Convert SQLAlchemy object to Pydantic Schema
-        banner = BannerCacheSchema.model_validate(banner_db)
-        
-        # Save to cache
-        cache.set(cache_key, banner.model_dump(mode='json'), expire=settings.CACHE_EXPIRE)
-    
-    # Perform gacha pulling
-    engine = GachaEngine(banner=banner, db=db) # banner must be GachaBanner
-    student_list = engine.draw(amount)
+        # Perform gacha pulling
+        student_list = engine.draw(amount)
 
     # Create GachaStudentSchema
-    result_schema = _serialize_gacha_student(student_list, banner, request)
+    with timer.phase("serialize"):
+        result_schema = _serialize_gacha_student(student_list, engine.sampler, request)
 
     # Return response pulling result immediately
     if current_user is None:
         if settings.DEBUG_MODE:
             LOGGER.debug("Guest is pulling. Skipping transaction history.")
-        
+
+        response.headers["Server-Timing"] = timer.server_timing()
         return GachaPullResponse(
             results=result_schema,
             unlocked_achievements=[]
@@ -184,13 +286,19 @@ def _perform_pull(
     # Perform saving transaction and achievement database before response
     if settings.DEBUG_MODE:
         LOGGER.debug(f"User '{current_user.username}' is pulling. Processing inventory and transactions...")
-    _insert_transaction(result_schema, banner, db, current_user, cache)
-    unlocked_achievements = _check_achievement(result_schema, request, db, current_user)
-    
+    new_ids, unlocked_achievements = _persist_pull(
+        [entry.id for entry in student_list],
+        [entry.rarity for entry in student_list],
+        banner_id, request, db, current_user, cache, timer
+    )
+    _mark_new_students(result_schema, new_ids)
+
+    response.headers["Server-Timing"] = timer.server_timing()
+
     # --- Format the final response, including any unlocked achievements ---
     return GachaPullResponse(
         results=result_schema,
-        unlocked_achievements=unlocked_achievements # Mocked for now
+        unlocked_achievements=unlocked_achievements
     )
 
 # --- Endpoints ---
@@ -199,22 +307,82 @@ def _perform_pull(
 def perform_gacha_pull_single(
     banner_id: int,
     request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     current_user: User | None = Depends(get_optional_current_user),
     cache: Cache = Depends(get_cache)
 ):
     return _perform_pull(
-        banner_id=banner_id, amount=1, db=db, request=request, current_user=current_user, cache=cache
+        banner_id=banner_id, amount=1, db=db, request=request, response=response, current_user=current_user, cache=cache
     )
 
 @router.post("/{banner_id}/pull_ten", response_model=GachaPullResponse)
 def perform_gacha_pull_ten(
     banner_id: int,
     request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     current_user: User | None = Depends(get_optional_current_user),
     cache: Cache = Depends(get_cache)
 ):
     return _perform_pull(
-        banner_id=banner_id, amount=10, db=db, request=request, current_user=current_user, cache=cache
-    )
\ No newline at end of file
+        banner_id=banner_id, amount=10, db=db, request=request, response=response, current_user=current_user, cache=cache
+    )
+
+@router.post("/{banner_id}/pull_batch", response_model=GachaBatchResponse)
+def perform_gacha_pull_batch(
+    banner_id: int,
+    request: Request,
+    response: Response,
+    count: int = Query(..., ge=10, le=settings.GACHA_BATCH_MAX_PULLS, multiple_of=10, description="Number of pulls, done as 10-pulls"),
+    db: Session = Depends(get_db),
+    current_user: User | None = Depends(get_optional_current_user),
+    cache: Cache = Depends(get_cache)
+):
+    """
+    Performs `count` pulls in one request. All draws run in one pass, the writes
+    are bulk statements and achievements are checked once at the end. Results
+    are aggregated per student instead of one entry per pull.
+    """
+    timer = PhaseTimer()
+
+    with timer.phase("draw"):
+        engine = GachaEngine.for_banner(banner_id, db)
+        if engine is None:
+            raise HTTPException(status_code=404, detail="Banner not found")
+
+        entry_list = engine.draw(count)
+        rarities = [entry.rarity for entry in entry_list]
+        rarity_counter = Counter(rarities)
+
+    new_ids: Set[int] = set()
+    unlocked_achievements: List[AchievementResponse] = []
+    if current_user is not None:
+        if settings.DEBUG_MODE:
+            LOGGER.debug(f"User '{current_user.username}' is pulling x{count}. Processing inventory and transactions...")
+        new_ids, unlocked_achievements = _persist_pull(
+            [entry.id for entry in entry_list], rarities, banner_id, request, db, current_user, cache, timer
+        )
+
+    with timer.phase("serialize"):
+        # Keep first-pulled order so the response is stable for the client
+        student_counts = Counter(entry.id for entry in entry_list)
+        students = [
+            GachaBatchStudentSchema(
+                student=_create_entry_response(engine.sampler.students[sid], request),
+                count=pulled,
+                is_pickup=sid in engine.sampler.pickup_ids,
+                is_new=sid in new_ids
+            )
+            for sid, pulled in student_counts.items()
+        ]
+
+    response.headers["Server-Timing"] = timer.server_timing()
+    return GachaBatchResponse(
+        total_pulls=count,
+        r3_count=rarity_counter.get(3, 0),
+        r2_count=rarity_counter.get(2, 0),
+        r1_count=rarity_counter.get(1, 0),
+        students=students,
+        unlocked_achievements=unlocked_achievements
+    )
@@ -1,123 +1,174 @@
-import hashlib
 import logging
-from fastapi import APIRouter, Depends, HTTPException, Request
-from fastapi.responses import Response
-from sqlalchemy.orm import Session, joinedload
-from typing import Callable, Tuple
+from dataclasses import asdict
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import FileResponse, Response
+from sqlalchemy.orm import Session
+from pathlib import Path
+from typing import Callable, Literal, Optional, Tuple
 
 from ..config import settings
 from ..util.cache import get_cache, Cache
+from ..util.cache_aside import cached
 from ..util.database import get_db
-from ..util.models import Achievement, Student, School, GachaBanner
+from ..util.GachaEngine import SAMPLER_REGISTRY
+from ..util.image_store import IMAGE_STORE
+from ..util.image_variants import select_rendition
+from ..util.models import Achievement, ImageAsset, Student, School, GachaBanner, Version
+from ..util.schemas.SpriteSheetResponse import SpriteSheetResponse
+from ..util.sprite_sheet import build_sprite_sheet
 
 CACHE_CONTROL_HEADER = "public, max-age=86400"
+IMMUTABLE_CACHE_CONTROL_HEADER = "public, max-age=31536000, immutable" # URL contains the content hash
 LOGGER = logging.getLogger(__name__)
 router = APIRouter()
 
+# Rendition selectors shared by every image endpoint (see util/image_variants.py)
+WidthQuery = Query(None, alias="w", ge=1, le=4096, description="Display width in pixels; served from the nearest precomputed width")
+FormatQuery = Query(None, alias="format", description="`webp` for the WebP rendition; the original format otherwise")
+
 # --- Helper functions
 
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    `If-None-Match` check (weak comparison): accepts `*`, a list of tags, weak
+    `W/` tags, and the unquoted tags served before ETags were quoted.
+    """
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag.strip('"') == etag:
+            return True
+    return False
+
 def serve_image(
     request: Request,
     cache: Cache,
     cache_key: str,
-    fetch_data_func: Callable[[], Tuple[bytes, str]], # Returns (bytes, filename)
+    fetch_data_func: Callable[[], Tuple[Optional[str], Optional[str], str]], # Returns (sha256, mime, filename)
+    width: Optional[int] = None,
+    image_format: Optional[str] = None,
 ):
-    # Default variables
-    etag = None
-    filename = "image.png"
-    
-    # Get meta data from cache
+    # Get meta data from cache, else the image columns from db (never the bytes)
     cached_data = cache.get(cache_key)
-    if cached_data:
-        etag = cached_data['etag']
-        filename = cached_data['filename']
-        # Check Browser Cache
+    if cached_data and 'mime' in cached_data: # Entries cached before the image store have no mime
+        etag, mime, filename = cached_data['etag'], cached_data['mime'], cached_data['filename']
+    else:
         if settings.DEBUG_MODE:
-            LOGGER.debug(f"{request.headers.get("if-none-match")} || {etag}")
-        if request.headers.get("if-none-match") == etag:
-            if settings.DEBUG_MODE:
-                LOGGER.debug(f"CACHE HIT (Browser - 304) for {cache_key}")
-            headers = {
-                "Cache-Control": CACHE_CONTROL_HEADER,
-                "ETag": etag,
-                "Content-Disposition": f'inline; filename="{filename}"'
-            }
-            return Response(status_code=304, headers=headers)
-        
-    # Get image data from db
-    if settings.DEBUG_MODE:
-        LOGGER.debug(f"FETCHING DATA for {cache_key}")
-    image_bytes, filename = fetch_data_func()
-    
-    if not image_bytes:
-        raise HTTPException(status_code=404, detail="Image data not found")
+            LOGGER.debug(f"FETCHING DATA for {cache_key}")
+        etag, mime, filename = fetch_data_func()
+        if not etag:
+            raise HTTPException(status_code=404, detail="Image data not found")
 
-    # Generate ETag
-    etag = hashlib.sha1(image_bytes).hexdigest()
+        # The store is content-addressed, so the hash is the ETag
+        data_to_cache = {
+            "etag": etag,
+            "mime": mime,
+            "filename": filename
+        }
+        # Deleted with the catalog when an image changes, so it can outlive CACHE_EXPIRE
+        cache.set(cache_key, data_to_cache, expire=settings.IMAGE_CACHE_EXPIRE)
 
-    # Save to Cache
-    data_to_cache = {
-        "etag": etag,
-        "filename": filename
-    }
-    cache.set(cache_key, data_to_cache, expire=settings.CACHE_EXPIRE)
+    # Original or precomputed rendition; each one has its own ETag
+    rendition = select_rendition(etag, mime, width=width, image_format=image_format)
+    if rendition.extension:
+        filename = f"{Path(filename).stem}.{rendition.extension}"
 
-    # Send response
     headers = {
         "Cache-Control": CACHE_CONTROL_HEADER,
-        "ETag": etag,
+        "ETag": f'"{rendition.etag}"',
         "Content-Disposition": f'inline; filename="{filename}"'
     }
 
-    # Check Browser Cache (DB Path)
-    if request.headers.get("if-none-match") == etag:
+    # Check Browser Cache: answered from the digest (and a stat of the rendition), the file is never opened
+    if etag_matches(request.headers.get("if-none-match"), rendition.etag):
+        if settings.DEBUG_MODE:
+            LOGGER.debug(f"CACHE HIT (Browser - 304) for {cache_key}")
         return Response(status_code=304, headers=headers)
-    
-    return Response(content=image_bytes, media_type="image/png", headers=headers)
+
+    if not rendition.path.is_file():
+        LOGGER.error(f"Image {etag} of {cache_key} is missing from the image store ({rendition.path})")
+        raise HTTPException(status_code=404, detail="Image data not found")
+
+    # Sent with sendfile where the server supports it
+    return FileResponse(rendition.path, media_type=rendition.mime, headers=headers)
 
 # --- Endpoints ---
 
 @router.get("/achievement/{achievement_id}", name="serve_achievement_image")
-def serve_achievement_image(achievement_id: int, request: Request, db: Session = Depends(get_db), cache: Cache = Depends(get_cache)):
+def serve_achievement_image(
+    achievement_id: int,
+    request: Request,
+    width: Optional[int] = WidthQuery,
+    image_format: Optional[Literal["webp"]] = FormatQuery,
+    db: Session = Depends(get_db),
+    cache: Cache = Depends(get_cache),
+):
     cache_key = f"image:achievement:{achievement_id}"
     
     def fetch_achievement():
-        obj = db.query(Achievement).filter_by(id=achievement_id).first()
-        if not obj or not obj.image_data:
+        row = db.query(Achievement.image_sha256, Achievement.image_mime, Achievement.key).filter(Achievement.id == achievement_id).first()
+        if not row or not row.image_sha256:
             raise HTTPException(status_code=404, detail="Not found")
         
-        return obj.image_data, f"{obj.key}.png"
+        return row.image_sha256, row.image_mime, f"{row.key}.png"
     
-    return serve_image(request, cache, cache_key, fetch_achievement)
+    return serve_image(request, cache, cache_key, fetch_achievement, width, image_format)
 
 @router.get("/banner/{banner_id}", name="serve_banner_image")
-def serve_banner_image(banner_id: int, request: Request, db: Session = Depends(get_db), cache: Cache = Depends(get_cache)):
+def serve_banner_image(
+    banner_id: int,
+    request: Request,
+    width: Optional[int] = WidthQuery,
+    image_format: Optional[Literal["webp"]] = FormatQuery,
+    db: Session = Depends(get_db),
+    cache: Cache = Depends(get_cache),
+):
     cache_key = f"image:banner:{banner_id}"
     
     def fetch_banner():
-        obj = db.query(GachaBanner).filter_by(id=banner_id).first()
-        if not obj or not obj.image_data:
+        row = db.query(GachaBanner.image_sha256, GachaBanner.image_mime, GachaBanner.name).filter(GachaBanner.id == banner_id).first()
+        if not row or not row.image_sha256:
             raise HTTPException(status_code=404, detail="Not found")
         
-        return obj.image_data, f"{obj.name}.png"
+        return row.image_sha256, row.image_mime, f"{row.name}.png"
     
-    return serve_image(request, cache, cache_key, fetch_banner)
+    return serve_image(request, cache, cache_key, fetch_banner, width, image_format)
 
 @router.get("/school/{school_id}", name="serve_school_image")
-def serve_school_image(school_id: int, request: Request, db: Session = Depends(get_db), cache: Cache = Depends(get_cache)):
+def serve_school_image(
+    school_id: int,
+    request: Request,
+    width: Optional[int] = WidthQuery,
+    image_format: Optional[Literal["webp"]] = FormatQuery,
+    db: Session = Depends(get_db),
+    cache: Cache = Depends(get_cache),
+):
     
     cache_key = f"image:school:{school_id}"
     def fetch_school():
-        obj = db.query(School).filter_by(id=school_id).first()
-        if not obj or not obj.image_data:
+        row = db.query(School.image_sha256, School.image_mime, School.name).filter(School.id == school_id).first()
+        if not row or not row.image_sha256:
             raise HTTPException(status_code=404, detail="Not found")
         
-        return obj.image_data, f"{obj.name}.png"
+        return row.image_sha256, row.image_mime, f"{row.name}.png"
     
-    return serve_image(request, cache, cache_key, fetch_school)
+    return serve_image(request, cache, cache_key, fetch_school, width, image_format)
 
 @router.get("/student/{student_id}/{image_type}", name="serve_student_image")
-def serve_student_image(student_id: int, image_type: str, request: Request, db: Session = Depends(get_db), cache: Cache = Depends(get_cache)):
+def serve_student_image(
+    student_id: int,
+    image_type: str,
+    request: Request,
+    width: Optional[int] = WidthQuery,
+    image_format: Optional[Literal["webp"]] = FormatQuery,
+    db: Session = Depends(get_db),
+    cache: Cache = Depends(get_cache),
+):
     
     if image_type not in ["portrait", "artwork"]:
         raise HTTPException(status_code=400, detail="Invalid image type")
@@ -125,25 +176,101 @@ def serve_student_image(student_id: int, image_type: str, request: Request, db:
     cache_key = f"image:student:{student_id}:{image_type}"
 
     def fetch_student():
-        obj = db.query(Student).options(
-            joinedload(Student.asset),
-            joinedload(Student.version) # Load version for the filename
-        ).filter(Student.id == student_id).first()
+        # Logic to pick the columns
+        sha256_column = getattr(ImageAsset, f"{image_type}_sha256")
+        mime_column = getattr(ImageAsset, f"{image_type}_mime")
 
-        if not obj or not obj.asset:
+        row = (
+            db.query(sha256_column, mime_column, Student.name, Version.name)
+            .join(ImageAsset, Student.asset_id == ImageAsset.id)
+            .join(Version, Student.version_id == Version.id) # Version name for the filename
+            .filter(Student.id == student_id)
+            .first()
+        )
+
+        if not row:
             raise HTTPException(status_code=404, detail="Student asset not found")
-        
-        # Logic to pick the column
-        img_data = None
-        if image_type == "portrait":
-            img_data = obj.asset.portrait_data
-        elif image_type == "artwork":
-            img_data = obj.asset.artwork_data
-        
-        if not img_data:
+
+        sha256, mime, student_name, version_name = row
+        if not sha256:
              raise HTTPException(status_code=404, detail=f"No data for {image_type}")
         
-        filename = f"{obj.name}_{obj.version.name}_{image_type}.png"
-        return img_data, filename
+        filename = f"{student_name}_{version_name}_{image_type}.png"
+        return sha256, mime, filename
     
-    return serve_image(request, cache, cache_key, fetch_student)
+    return serve_image(request, cache, cache_key, fetch_student, width, image_format)
+
+# --- Sprite sheets: every portrait of a page in one image ---
+
+def sprite_tile_width(
+    tile_width: int = Query(128, alias="w", description="Width of each portrait in the sprite sheet, one of SPRITE_TILE_WIDTHS"),
+) -> int:
+    # A fixed set: any other width would build (and store) one more sheet per page
+    if tile_width not in settings.SPRITE_TILE_WIDTHS:
+        raise HTTPException(status_code=422, detail=f"w must be one of {settings.SPRITE_TILE_WIDTHS}")
+    return tile_width
+
+def sprite_sheet_response(request: Request, slot: str, portraits, tile_width: int) -> SpriteSheetResponse:
+    sheet = build_sprite_sheet(slot, portraits, tile_width)
+    if sheet is None:
+        raise HTTPException(status_code=503, detail="Sprite sheets are not available")
+
+    return SpriteSheetResponse(
+        image_url=str(request.url_for('serve_sprite_sheet', slot=sheet.slot, sha256=sheet.sha256)),
+        width=sheet.width,
+        height=sheet.height,
+        tile_width=sheet.tile_width,
+        sprites={key: asdict(sprite) for key, sprite in sheet.sprites.items()},
+    )
+
+def portrait_query(db: Session):
+    return (
+        db.query(Student.id, ImageAsset.portrait_sha256, ImageAsset.portrait_mime)
+        .join(ImageAsset, Student.asset_id == ImageAsset.id)
+        .filter(ImageAsset.portrait_sha256.isnot(None))
+    )
+
+@router.get("/sprites/banner/{banner_id}", response_model=SpriteSheetResponse, name="serve_banner_sprites")
+@cached("image:sprites:banner:{banner_id}:{tile_width}", ttl=settings.IMAGE_CACHE_EXPIRE)
+def serve_banner_sprites(
+    banner_id: int,
+    request: Request,
+    tile_width: int = Depends(sprite_tile_width),
+    db: Session = Depends(get_db),
+    cache: Cache = Depends(get_cache),
+):
+    """Portraits of every student in the banner's pools (the students of its details page)."""
+    sampler = SAMPLER_REGISTRY.get(banner_id, db)
+    if not sampler:
+        raise HTTPException(status_code=404, detail="Banner not found")
+
+    portraits = portrait_query(db).filter(Student.id.in_(list(sampler.students))).all()
+    return sprite_sheet_response(request, f"banner-{banner_id}-{tile_width}", portraits, tile_width)
+
+@router.get("/sprites/catalog", response_model=SpriteSheetResponse, name="serve_catalog_sprites")
+@cached("image:sprites:catalog:{tile_width}", ttl=settings.IMAGE_CACHE_EXPIRE)
+def serve_catalog_sprites(
+    request: Request,
+    tile_width: int = Depends(sprite_tile_width),
+    db: Session = Depends(get_db),
+    cache: Cache = Depends(get_cache),
+):
+    """Portraits of every student (the collection page)."""
+    return sprite_sheet_response(request, f"catalog-{tile_width}", portrait_query(db).all(), tile_width)
+
+@router.get("/sprites/sheet/{slot}/{sha256}", name="serve_sprite_sheet")
+def serve_sprite_sheet(slot: str, sha256: str, request: Request):
+    # Nothing to look up: the hash is the file name and the ETag, and the content never changes.
+    # Only sheets are served from here, never the other images of the store.
+    try:
+        path = IMAGE_STORE.sprite_sheet_path(slot, sha256)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Not found")
+
+    headers = {"Cache-Control": IMMUTABLE_CACHE_CONTROL_HEADER, "ETag": f'"{sha256}"'}
+    if etag_matches(request.headers.get("if-none-match"), sha256):
+        return Response(status_code=304, headers=headers)
+    if not path.is_file():
+        raise HTTPException(status_code=404, detail="Not found")
+
+    return FileResponse(path, media_type="image/webp", headers=headers)
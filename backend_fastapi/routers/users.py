@@ -5,7 +5,7 @@ from typing import Optional
 
 from ..util.models import User, Role
 from ..util.auth import create_access_token, get_required_current_user, get_password_hash, verify_password
-from ..util.schemas.User import UserCreate, UserSchema, Token
+from ..util.schemas.user import UserCreate, UserSchema, Token
 from ..util.database import get_db
 
 router = APIRouter()
@@ -0,0 +1,6 @@
+import os
+
+# Read by config.py when the app is imported; tests never need Redis or a real secret
+os.environ.setdefault("SECRET_KEY", "test")
+os.environ.setdefault("CACHE_TYPE", "memory")
+os.environ.setdefault("CACHE_WARMUP", "false")
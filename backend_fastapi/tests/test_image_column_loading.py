@@ -0,0 +1,118 @@
+"""
+Regression guard for image column loading.
+
+Seeds a throwaway SQLite database whose rows still carry legacy image BLOBs,
+then calls the catalog endpoints and the banner compile on a cold cache. No
+SELECT may name an image BLOB column (they must stay deferred), and no check
+may run more statements than its ceiling (e.g. a lazy load per student).
+
+Run from the project root:
+
+    python -m pytest backend_fastapi/tests
+"""
+import re
+from decimal import Decimal
+from typing import List, Tuple
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from backend_fastapi.main import app
+from backend_fastapi.util.auth import get_required_current_user
+from backend_fastapi.util.cache import get_cache
+from backend_fastapi.util.database import Base, get_db
+from backend_fastapi.util.GachaEngine import compile_banner
+from backend_fastapi.util.models import GachaBanner, GachaPreset, ImageAsset, Role, School, Student, User, Version
+
+FIXTURE_STUDENTS = 50
+BLOB_SIZE = 1024 # Only the SQL is checked, the size does not matter
+BLOB_COLUMNS = re.compile(r"\b(image_data|portrait_data|artwork_data)\b")
+
+# (name, statement ceiling); one statement per query the check needs, whatever FIXTURE_STUDENTS is
+CHECKS: List[Tuple[str, int]] = [
+    ("/api/students/", 1),
+    ("/api/schools/", 1),
+    ("/api/banners/", 4),
+    ("/api/banners/{banner_id}/details/", 5),
+    ("/api/dashboard/collection", 2),
+    ("compile_banner", 7),
+]
+
+def seed_fixture(db) -> Tuple[int, int]:
+    """Rows with both a legacy BLOB and image store columns. Returns (banner id, user id)."""
+    blob = b"\0" * BLOB_SIZE
+    digest = "0" * 64
+    role = Role(name="member")
+    version = Version(name="Original")
+    school = School(name="school", image_data=blob, image_sha256=digest, image_mime="image/png")
+    preset = GachaPreset(name="preset", pickup_rate=Decimal("0.7"), r3_rate=Decimal("3"), r2_rate=Decimal("18.5"), r1_rate=Decimal("78.5"))
+    db.add_all([role, version, school, preset])
+    db.flush()
+
+    students = []
+    for i in range(FIXTURE_STUDENTS):
+        asset = ImageAsset(portrait_data=blob, artwork_data=blob, portrait_sha256=digest, artwork_sha256=digest, pair_hash=f"{i:064d}")
+        db.add(asset)
+        db.flush()
+        students.append(Student(name=f"student_{i}", rarity=1 + i % 3, version_id=version.id, school_id=school.id, asset_id=asset.id))
+    banner = GachaBanner(name="banner", image_data=blob, image_sha256=digest, preset_id=preset.id, included_versions=[version])
+    user = User(username="user", hashed_password="-", role_id=role.id)
+    db.add_all([*students, banner, user])
+    db.commit()
+    return banner.id, user.id
+
+@pytest.fixture(scope="module")
+def checks(tmp_path_factory):
+    """Check name -> (call, statements recorded since the last clear)."""
+    engine = create_engine(f"sqlite:///{tmp_path_factory.mktemp('db') / 'image_columns.sqlite3'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    with Session() as db:
+        banner_id, user_id = seed_fixture(db)
+
+    statements: List[str] = []
+    event.listen(engine, "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement))
+
+    def override_get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def override_current_user():
+        with Session() as db:
+            return db.get(User, user_id)
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_required_current_user] = override_current_user
+    client = TestClient(app) # Not started as a context manager: no lifespan, no cache warm-up
+
+    def compile_pool():
+        with Session() as db:
+            compile_banner(banner_id, db)
+
+    calls: dict = {name: (lambda path=name: client.get(path.format(banner_id=banner_id))) for name, _ in CHECKS if name.startswith("/")}
+    calls["compile_banner"] = compile_pool
+    yield {name: (call, statements) for name, call in calls.items()}
+
+    app.dependency_overrides.clear()
+    engine.dispose()
+
+@pytest.mark.parametrize("name, ceiling", CHECKS)
+def test_image_columns_stay_deferred(checks, name: str, ceiling: int):
+    call, statements = checks[name]
+
+    # A cached response runs no statement at all
+    get_cache().delete_by_pattern("*")
+    statements.clear()
+    response = call()
+    assert getattr(response, "status_code", 200) == 200
+    assert statements, "Answered from a cache: nothing was checked"
+
+    selects = [" ".join(s.split()) for s in statements if s.lstrip().upper().startswith("SELECT")]
+    assert [s for s in selects if BLOB_COLUMNS.search(s)] == []
+    assert len(statements) <= ceiling, "\n".join(" ".join(s.split())[:160] for s in statements)
@@ -1,34 +1,130 @@
-import json
 import logging
-from pathlib import Path
-from typing import List, Optional, Set
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Dict, FrozenSet, Iterable, List, Mapping, Optional, Set, Tuple
 from sqlalchemy.orm import Session
-from .models import User, UserInventory, Achievement, UnlockAchievement, Student, Version
-from .schemas.GachaResponse import GachaStudentSchema 
+from .catalog import ACHIEVEMENTS, CATALOG, get_content_version
+from .models import User, UserInventory, Achievement, UnlockAchievement, achievement_requirement_association
 
 LOGGER = logging.getLogger(__name__)
 
-# --- Load Collection Achievement Definitions at Startup ---
-# This replicates your Django logic of loading JSON files once.
-COLLECTION_SETS = {}
-try:
-    achievements_dir = Path(__file__).parent / "data" / "achievements"
-    for file_path in achievements_dir.glob("*.json"):
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-            if data.get("category") == "COLLECTION" and "students" in data:
-                COLLECTION_SETS[data["key"]] = data["students"]
-except Exception as e:
-    LOGGER.error(f"WARNING: Could not load collection achievement definitions: {e}")
+@dataclass(frozen=True)
+class AchievementDefinition:
+    """Lightweight, immutable copy of an Achievement row (no image bytes)."""
+    id: int
+    key: str
+    name: str
+    description: Optional[str]
+    category: str
+    has_image: bool
+    required_student_ids: FrozenSet[int]
+
+@dataclass(frozen=True)
+class AchievementSnapshot:
+    """
+    All achievement definitions, plus the inverted index
+    student id -> keys of the collections that contain it.
+    """
+    version: Tuple[int, int] # (achievements, catalog) content versions
+    by_key: Mapping[str, AchievementDefinition]
+    by_id: Mapping[int, AchievementDefinition]
+    collections: Mapping[str, FrozenSet[int]]
+    by_student: Mapping[int, Tuple[str, ...]]
+
+def _current_version() -> Tuple[int, int]:
+    return get_content_version(ACHIEVEMENTS), get_content_version(CATALOG)
+
+class AchievementRegistry:
+    """
+    Process-wide cache of achievement definitions, loaded from the Achievement
+    table (collection members included) in one query. Shared by all engines and
+    reloaded automatically after achievements or students are edited.
+    """
+    def __init__(self):
+        self._snapshot: Optional[AchievementSnapshot] = None
+        self._lock = threading.Lock()
+
+    def get(self, db: Session) -> AchievementSnapshot:
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == _current_version():
+            return snapshot
+
+        with self._lock:
+            if self._snapshot is None or self._snapshot.version != _current_version():
+                self._snapshot = self._load(db)
+            return self._snapshot
+
+    def reload(self, db: Session) -> AchievementSnapshot:
+        with self._lock:
+            self._snapshot = self._load(db)
+            return self._snapshot
+
+    def _load(self, db: Session) -> AchievementSnapshot:
+        version = _current_version()
+        rows = (
+            db.query(
+                Achievement.id,
+                Achievement.key,
+                Achievement.name,
+                Achievement.description,
+                Achievement.category,
+                Achievement.image_sha256.isnot(None),
+                achievement_requirement_association.c.student_id
+            )
+            .outerjoin(
+                achievement_requirement_association,
+                achievement_requirement_association.c.achievement_id == Achievement.id
+            )
+            .all()
+        )
+
+        fields: Dict[str, tuple] = {}
+        required: Dict[str, Set[int]] = defaultdict(set)
+        for ach_id, key, name, description, category, has_image, student_id in rows:
+            fields[key] = (ach_id, key, name, description, category, bool(has_image))
+            if student_id is not None:
+                required[key].add(student_id)
+
+        by_key: Dict[str, AchievementDefinition] = {}
+        collections: Dict[str, FrozenSet[int]] = {}
+        by_student: Dict[int, List[str]] = defaultdict(list)
+        for key, values in fields.items():
+            definition = AchievementDefinition(*values, required_student_ids=frozenset(required[key]))
+            by_key[key] = definition
+
+            if definition.category != "COLLECTION":
+                continue
+            if not definition.required_student_ids:
+                LOGGER.warning(f"Collection achievement '{key}' has no required students and can never be unlocked.")
+                continue
+            collections[key] = definition.required_student_ids
+            for student_id in definition.required_student_ids:
+                by_student[student_id].append(key)
+
+        LOGGER.debug(f"Loaded {len(by_key)} achievement definitions ({len(collections)} collections).")
+        return AchievementSnapshot(
+            version=version,
+            by_key=MappingProxyType(by_key),
+            by_id=MappingProxyType({definition.id: definition for definition in by_key.values()}),
+            collections=MappingProxyType(collections),
+            by_student=MappingProxyType({sid: tuple(keys) for sid, keys in by_student.items()}),
+        )
+
+# Shared across all requests in this worker process
+ACHIEVEMENT_REGISTRY = AchievementRegistry()
 
 class AchievementEngine:
-    def __init__(self, user: User, db: Session):
+    def __init__(self, user: User, db: Session, notified: bool = True):
         
         if not user:
             raise ValueError("A valid user is required.")
         
         self.user = user
         self.db = db
+        self.notified = notified # False when unlocks are found in the background and delivered later
+        self.definitions = ACHIEVEMENT_REGISTRY.get(db)
 
         # Fetch all unlocked achievement keys for current user.
         self.unlocked_keys: Set[str] = {
@@ -38,31 +134,48 @@ class AchievementEngine:
             ).filter_by(user_id=self.user.id)
         }
 
-    def _award(self, unlock_key: str) -> Optional[Achievement]:
+    def _award(self, unlock_key: str) -> Optional[AchievementDefinition]:
         """Awards an achievement if not already unlocked."""
         if unlock_key in self.unlocked_keys:
             return None
 
-        achievement_to_award = self.db.query(Achievement).filter_by(key=unlock_key).first()
+        achievement_to_award = self.definitions.by_key.get(unlock_key)
         if not achievement_to_award:
             LOGGER.error(f"ERROR: Achievement with key '{unlock_key}' not found in DB.")
             return None
         
         new_unlock = UnlockAchievement(
             user_id=self.user.id,
-            achievement_id=achievement_to_award.id
+            achievement_id=achievement_to_award.id,
+            is_notified=self.notified
         )
         self.db.add(new_unlock)
         self.unlocked_keys.add(unlock_key) # Update in-memory set
         LOGGER.info(f"ACHIEVEMENT UNLOCKED for {self.user.username}: {achievement_to_award.name}")
         return achievement_to_award
 
+    def check_pull_achievements(
+        self,
+        max_r3_per_pull: int,
+        initial_pull_count: int,
+        pull_amount: int,
+        new_student_ids: Optional[Iterable[int]] = None,
+    ) -> List[AchievementDefinition]:
+        """Runs every rule that a gacha pull can trigger."""
+        newly_unlocked = []
+        newly_unlocked.extend(self.check_luck_achievements(max_r3_per_pull))
+        newly_unlocked.extend(self.check_milestone_achievements(initial_pull_count, pull_amount))
+        newly_unlocked.extend(self.check_collection_achievements(new_student_ids))
+        return newly_unlocked
+
     # --- "RULE" METHODS ---
 
-    def check_luck_achievements(self, pulled_students: List[GachaStudentSchema]) -> List[Achievement]:
-        """Checks for achievements related to a single gacha pull (e.g., multi-3-star)."""
+    def check_luck_achievements(self, r3_count: int) -> List[AchievementDefinition]:
+        """
+        Checks for achievements related to a single gacha pull (e.g., multi-3-star).
+        `r3_count` is the number of 3-stars in the luckiest single pull.
+        """
         newly_unlocked = []
-        r3_count = sum(1 for result in pulled_students if result.student.rarity == 3)
         
         if r3_count >= 2:
             if ach := self._award('LUCK_DOUBLE_R3'):
@@ -74,25 +187,35 @@ class AchievementEngine:
         
         return newly_unlocked
 
-    def check_collection_achievements(self) -> List[Achievement]:
-        """Checks all collection-based achievements against the user's full inventory."""
+    def check_collection_achievements(self, new_student_ids: Optional[Iterable[int]] = None) -> List[AchievementDefinition]:
+        """
+        Checks collection-based achievements. A collection can only become complete
+        when one of its members is newly obtained, so with `new_student_ids` only the
+        collections containing those students are rechecked, against the user's
+        ownership of just their members. Pass None to recheck every collection.
+        """
         newly_unlocked = []
-        
-        # Get the user's full collection for checking
-        owned_students_query = (
-            self.db.query(Student.name, Version.name)                       # Query student name and version columns
-            .join(UserInventory, UserInventory.student_id == Student.id)    # Join table UserInventory where Userinventory has student id ...
-            .join(Version, Student.version_id == Version.id)                # Join table Version where Student has version id ...
-            .filter(UserInventory.user_id == self.user.id)                  # Filter UserInventory where user id ...
-        )
-        user_owned_set = {f"{name}|{version}" for name, version in owned_students_query}
+        index = self.definitions
 
-        for unlock_key, required_students in COLLECTION_SETS.items():
-            if unlock_key in self.unlocked_keys:
-                continue
-            
-            required_set = {f"{req['name']}|{req['version']}" for req in required_students}
-            if not required_set.issubset(user_owned_set):
+        if new_student_ids is None:
+            candidate_keys = set(index.collections)
+        else:
+            candidate_keys = {key for sid in new_student_ids for key in index.by_student.get(sid, ())}
+        candidate_keys -= self.unlocked_keys
+        if not candidate_keys:
+            return newly_unlocked
+
+        # Ownership of only the members of the candidate collections
+        required_ids = set().union(*(index.collections[key] for key in candidate_keys))
+        owned_ids = {
+            item[0] for item in self.db.query(UserInventory.student_id).filter(
+                UserInventory.user_id == self.user.id,
+                UserInventory.student_id.in_(required_ids)
+            )
+        }
+
+        for unlock_key in sorted(candidate_keys):
+            if not index.collections[unlock_key] <= owned_ids:
                 continue
             
             ach = self._award(unlock_key)
@@ -101,7 +224,7 @@ class AchievementEngine:
         
         return newly_unlocked
         
-    def check_milestone_achievements(self, initial_pull_count: int, pull_amount: int) -> List[Achievement]:
+    def check_milestone_achievements(self, initial_pull_count: int, pull_amount: int) -> List[AchievementDefinition]:
         """Checks for achievements related to total pulls."""
         newly_unlocked = []
         final_pull_count = initial_pull_count + pull_amount
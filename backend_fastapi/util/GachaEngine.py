@@ -1,102 +1,319 @@
+import numpy as np
 import random
-from typing import List, Union
+import threading
+import time
+from dataclasses import dataclass
+from functools import cached_property
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+from sqlalchemy import and_, or_
 from sqlalchemy.orm import Session
+from .catalog import get_catalog_version
 from .models import GachaBanner, Student
-from .schemas.BannerResponse import BannerCacheSchema
+from .schemas.StudentResponse import StudentResponse
+from ..config import settings
 
-class GachaEngine:
+RARITY_KEYS = ("r3", "r2", "r1")
+
+@dataclass(frozen=True)
+class AliasTable:
+    """
+    Walker/Vose alias table. Samples an index from a fixed discrete
+    distribution in O(1) with a single random number.
+    """
+    prob: Tuple[float, ...]
+    alias: Tuple[int, ...]
+
+    @classmethod
+    def build(cls, weights: Sequence[float]) -> "AliasTable":
+        size = len(weights)
+        total = float(sum(weights))
+        if size == 0 or total <= 0:
+            raise ValueError("Alias table needs at least one positive weight.")
+
+        scaled = [float(w) * size / total for w in weights]
+        prob = [1.0] * size
+        alias = list(range(size))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+
+        while small and large:
+            s, l = small.pop(), large.pop()
+            prob[s] = scaled[s]
+            alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+
+        # Leftovers are 1.0 up to floating point error
+        return cls(prob=tuple(prob), alias=tuple(alias))
+
+    def sample(self) -> int:
+        # The integer part picks a column, the fractional part decides between it and its alias.
+        size = len(self.prob)
+        u = random.random() * size
+        i = min(int(u), size - 1) # Guard against u rounding up to size
+        return i if u - i < self.prob[i] else self.alias[i]
+
+    @cached_property
+    def _arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        return np.asarray(self.prob, dtype=np.float64), np.asarray(self.alias, dtype=np.int32)
+
+    def sample_array(self, rng: np.random.Generator, size: int) -> np.ndarray:
+        """Vectorized version of sample(); returns `size` indices as an int32 array."""
+        prob, alias = self._arrays
+        u = rng.random(size) * len(prob)
+        i = np.minimum(u.astype(np.int32), len(prob) - 1)
+        return np.where(u - i < prob[i], i, alias[i])
+
+@dataclass(frozen=True)
+class StudentPool:
+    student_ids: Tuple[int, ...]
+    table: AliasTable
+
+    @classmethod
+    def build(cls, student_ids: Sequence[int], weights: Sequence[float]) -> Optional["StudentPool"]:
+        if not student_ids or sum(weights) <= 0:
+            return None
+        return cls(student_ids=tuple(student_ids), table=AliasTable.build(weights))
+
+    def sample(self) -> int:
+        return self.student_ids[self.table.sample()]
+
+    @cached_property
+    def _id_array(self) -> np.ndarray:
+        return np.asarray(self.student_ids, dtype=np.int32)
+
+    def sample_array(self, rng: np.random.Generator, size: int) -> np.ndarray:
+        return self._id_array[self.table.sample_array(rng, size)]
+
+@dataclass(frozen=True)
+class StudentEntry:
+    """Request-independent snapshot of a pool student (no image URLs yet)."""
+    id: int
+    rarity: int
+    response: StudentResponse
+    has_asset: bool
+    school_has_image: bool
+
+@dataclass(frozen=True)
+class CompiledBanner:
+    """
+    Immutable, precompiled sampler for a banner. Built once per catalog
+    version so that pulling costs no database queries.
+    """
+    banner_id: int
+    version: int
+    compiled_at: float
+    pickup_ids: frozenset
+    students: Mapping[int, StudentEntry]
+    rarity_table: AliasTable            # Indexed like RARITY_KEYS
+    guaranteed_rarity_table: AliasTable # Same, with R1 rate absorbed by R2
+    pools: Mapping[str, Optional[StudentPool]]
+
+def compile_banner(banner_id: int, db: Session) -> Optional[CompiledBanner]:
+    """Builds the sampler for a banner from the database. Returns None if the banner does not exist."""
+    version = get_catalog_version()
+    banner = db.query(GachaBanner).filter_by(id=banner_id).first()
+    if not banner:
+        return None
+
+    if not banner.preset:
+        raise ValueError("Banner does not have a rate preset.")
+
+    # --- 1. Rates from the preset (Decimal -> float once, not per draw) ---
+    preset = banner.preset
+    rates = {
+        "r3": float(preset.r3_rate),
+        "r2": float(preset.r2_rate),
+        "r1": float(preset.r1_rate),
+    }
+    pickup_rate = float(preset.pickup_rate)
+    non_pickup_r3_rate = rates["r3"] - pickup_rate
+
+    # --- 2. Load pickups and the general pool in one query ---
+    pickup_ids = {s.id for s in banner.pickup_students}
+    excluded_ids = {s.id for s in banner.excluded_students}
+    included_version_ids = {v.id for v in banner.included_versions}
+
+    pool_filter = and_(
+        Student.version_id.in_(included_version_ids),
+        Student.id.not_in(pickup_ids | excluded_ids)
+    )
+    if not banner.include_limited:
+        pool_filter = and_(pool_filter, Student.is_limited == False)
+
+    student_rows = (
+        db.query(Student)
+        .filter(or_(Student.id.in_(pickup_ids), pool_filter))
+        .all()
+    )
+
+    students: Dict[int, StudentEntry] = {}
+    pool_ids: Dict[str, List[int]] = {"pickup": [], "r3": [], "r2": [], "r1": []}
+    for student in student_rows:
+        students[student.id] = StudentEntry(
+            id=student.id,
+            rarity=student.rarity,
+            response=StudentResponse.model_validate(student),
+            has_asset=student.asset_id is not None,
+            school_has_image=bool(student.school and student.school.image_sha256),
+        )
+        key = "pickup" if student.id in pickup_ids else f"r{student.rarity}"
+        if key in pool_ids:
+            pool_ids[key].append(student.id)
+
+    # --- 3. Per-student weights; pickups share the pickup rate inside the R3 pool ---
+    def _uniform(ids: List[int], rate: float) -> List[float]:
+        return [rate / len(ids)] * len(ids) if ids else []
+
+    r3_ids = pool_ids["pickup"] + pool_ids["r3"]
+    r3_weights = _uniform(pool_ids["pickup"], pickup_rate) + _uniform(pool_ids["r3"], non_pickup_r3_rate)
+
+    return CompiledBanner(
+        banner_id=banner.id,
+        version=version,
+        compiled_at=time.monotonic(),
+        pickup_ids=frozenset(pickup_ids),
+        students=MappingProxyType(students),
+        rarity_table=AliasTable.build([rates[k] for k in RARITY_KEYS]),
+        guaranteed_rarity_table=AliasTable.build([rates["r3"], rates["r2"] + rates["r1"], 0.0]),
+        pools=MappingProxyType({
+            "r3": StudentPool.build(r3_ids, r3_weights),
+            "r2": StudentPool.build(pool_ids["r2"], _uniform(pool_ids["r2"], rates["r2"])),
+            "r1": StudentPool.build(pool_ids["r1"], _uniform(pool_ids["r1"], rates["r1"])),
+        }),
+    )
+
+@dataclass(frozen=True)
+class SimulationResult:
+    """Bulk pull results as (n_trials, n_pulls) arrays, one row per simulated trial."""
+    student_ids: np.ndarray # int32, ids into CompiledBanner.students
+    rarities: np.ndarray    # int8, 3 / 2 / 1
+
+class SamplerRegistry:
     """
-    A stateless service class that handles the logic of performing gacha pulls,
+    Process-wide registry of compiled banners, keyed by banner id and catalog
+    version. Entries are replaced when the catalog changes or they reach max_age.
     """
-    def __init__(self, banner: Union[GachaBanner, BannerCacheSchema], db: Session):
-        if not banner.preset:
-            raise ValueError("Banner does not have a rate preset.")
-
-        self.banner = banner
-
-        # --- 1. Calculate rates from the preset ---
-        self.rates = {
-            "r3": banner.preset.r3_rate,
-            "r2": banner.preset.r2_rate,
-            "r1": banner.preset.r1_rate
-        }
-        # This is the rate for non-pickup 3-stars
-        self.non_pickup_r3_rate = self.rates["r3"] - banner.preset.pickup_rate
-
-        # --- 2. Build the student pools using SQLAlchemy ---
-        # Get IDs needed for filtering
-        pickup_ids = {s.id for s in banner.pickup_students}
-        excluded_ids = {s.id for s in banner.excluded_students}
-        included_version_ids = {v.id for v in banner.included_versions}
-
-        # Build the base query for the general pool
-        all_pool_students = db.query(Student).filter(
-            Student.version_id.in_(included_version_ids),
-            Student.id.not_in(pickup_ids | excluded_ids)
+    def __init__(self, max_age: int):
+        self.max_age = max_age
+        self._samplers: Dict[int, CompiledBanner] = {}
+        self._lock = threading.Lock()
+
+    def _is_fresh(self, sampler: Optional[CompiledBanner]) -> bool:
+        return (
+            sampler is not None
+            and sampler.version == get_catalog_version()
+            and time.monotonic() - sampler.compiled_at < self.max_age
         )
-        if not banner.include_limited:
-            all_pool_students = all_pool_students.filter(Student.is_limited == False)
-
-        self.pools = {
-            "pickup": banner.pickup_students,
-            "r3": [s for s in all_pool_students if s.rarity == 3],
-            "r2": [s for s in all_pool_students if s.rarity == 2],
-            "r1": [s for s in all_pool_students if s.rarity == 1],
-        }
-
-        # --- 3. Calculate rates and weights for the guaranteed pull ---
-        self.guaranteed_r2_rates = {
-            "r3": self.rates["r3"],
-            "r2": self.rates["r2"] + self.rates["r1"] # R1 rate is absorbed by R2
-        }
-
-        # --- 4. Pre-calculate weights for each pool ---
-        self.weights = {
-            "pickup": [banner.preset.pickup_rate / len(self.pools["pickup"])] * len(self.pools["pickup"]) if self.pools["pickup"] else [],
-            "r3": [self.non_pickup_r3_rate / len(self.pools["r3"])] * len(self.pools["r3"]) if self.pools["r3"] else [],
-            "r2": [self.rates["r2"] / len(self.pools["r2"])] * len(self.pools["r2"]) if self.pools["r2"] else [],
-            "r1": [self.rates["r1"] / len(self.pools["r1"])] * len(self.pools["r1"]) if self.pools["r1"] else [],
-        }
-    
-    def _draw_one(self, *, guarantee_r2_or_higher: bool = False) -> Student:
-        """Internal helper to perform a single pull. Returns a single SQLAlchemy Student object."""
-        active_rates = self.guaranteed_r2_rates if guarantee_r2_or_higher else self.rates
-        
+
+    def get(self, banner_id: int, db: Session) -> Optional[CompiledBanner]:
+        sampler = self._samplers.get(banner_id)
+        if self._is_fresh(sampler):
+            return sampler
+
+        # Compile under the lock so concurrent misses build the sampler only once
+        with self._lock:
+            sampler = self._samplers.get(banner_id)
+            if self._is_fresh(sampler):
+                return sampler
+            sampler = compile_banner(banner_id, db)
+            if sampler is None:
+                self._samplers.pop(banner_id, None)
+                return None
+            self._samplers[banner_id] = sampler
+            return sampler
+
+    def invalidate(self, banner_id: Optional[int] = None) -> None:
+        with self._lock:
+            if banner_id is None:
+                self._samplers.clear()
+            else:
+                self._samplers.pop(banner_id, None)
+
+# Shared across all requests in this worker process
+SAMPLER_REGISTRY = SamplerRegistry(max_age=settings.CACHE_EXPIRE)
+
+class GachaEngine:
+    """
+    A stateless service class that handles the logic of performing gacha pulls
+    against a precompiled banner sampler.
+    """
+    def __init__(self, sampler: CompiledBanner):
+        self.sampler = sampler
+
+    @classmethod
+    def for_banner(cls, banner_id: int, db: Session) -> Optional["GachaEngine"]:
+        """Returns an engine for the banner, or None if the banner does not exist."""
+        sampler = SAMPLER_REGISTRY.get(banner_id, db)
+        return cls(sampler) if sampler else None
+
+    def _draw_one(self, *, guarantee_r2_or_higher: bool = False) -> StudentEntry:
+        """Internal helper to perform a single pull in O(1)."""
+        rarity_table = self.sampler.guaranteed_rarity_table if guarantee_r2_or_higher else self.sampler.rarity_table
+
         # Layer 1: Determine Rarity
-        chosen_rarity = random.choices(
-            population=list(active_rates.keys()), 
-            weights=[float(w) for w in active_rates.values()], # Ensure weights are floats
-            k=1
-        )[0]
+        chosen_rarity = RARITY_KEYS[rarity_table.sample()]
 
         # Layer 2: Choose a student from the corresponding pool
-        if chosen_rarity == "r3":
-            combined_r3_pool = self.pools["pickup"] + self.pools["r3"]
-            combined_r3_weights = self.weights["pickup"] + self.weights["r3"]
-            if not combined_r3_pool:
-                raise Exception("Gacha Error: R3 Pool is empty.")
-            return random.choices(combined_r3_pool, weights=[float(w) for w in combined_r3_weights], k=1)[0]
-        
-        elif chosen_rarity == "r2":
-            if not self.pools["r2"]:
-                raise Exception("Gacha Error: R2 Pool is empty.")
-            return random.choices(self.pools["r2"], weights=[float(w) for w in self.weights["r2"]], k=1)[0]
-            
-        elif chosen_rarity == "r1": # Only reachable on a normal pull
-            if not self.pools["r1"]:
-                raise Exception("Gacha Error: R1 Pool is empty.")
-            return random.choices(self.pools["r1"], weights=[float(w) for w in self.weights["r1"]], k=1)[0]
-
-    def draw(self, amount: int) -> List[Student]:
-        """Performs a pull of a specified amount, handling 10-pull guarantees."""
-        if amount == 10:
-            # 9 r1~r3 pulls + 1 guaranteed r2+ pull
-            pulled_students = [self._draw_one() for _ in range(9)]
-            guaranteed_pull = self._draw_one(guarantee_r2_or_higher=True)
-            pulled_students.append(guaranteed_pull)
+        pool = self.sampler.pools[chosen_rarity]
+        if pool is None:
+            raise Exception(f"Gacha Error: {chosen_rarity.upper()} Pool is empty.")
+        return self.sampler.students[pool.sample()]
+
+    def draw(self, amount: int) -> List[StudentEntry]:
+        """
+        Performs a pull of a specified amount, handling 10-pull guarantees.
+        Multiples of 10 are drawn as consecutive 10-pulls in a single pass.
+        """
+        if amount >= 10 and amount % 10 == 0:
+            pulled_students = []
+            for _ in range(amount // 10):
+                # 9 r1~r3 pulls + 1 guaranteed r2+ pull
+                pulled_students.extend(self._draw_one() for _ in range(9))
+                pulled_students.append(self._draw_one(guarantee_r2_or_higher=True))
             return pulled_students
         elif amount == 1:
             return [self._draw_one()]
         else:
-            raise ValueError("Pull amount must be 1 or 10.")
-        
+            raise ValueError("Pull amount must be 1 or a multiple of 10.")
+
+    def simulate(self, n_pulls: int, n_trials: int = 1, seed: Optional[int] = None) -> SimulationResult:
+        """
+        Vectorized Monte Carlo version of draw() for offline rate analysis.
+        Each trial performs `n_pulls` pulls; when `n_pulls` is a multiple of 10
+        they are done as 10-pulls, so every 10th pull is a guaranteed R2+ pull.
+        """
+        if n_trials < 1:
+            raise ValueError("Number of trials must be at least 1.")
+        if n_pulls != 1 and (n_pulls < 10 or n_pulls % 10 != 0):
+            raise ValueError("Pull amount must be 1 or a multiple of 10.")
+
+        rng = np.random.default_rng(seed)
+        shape = (n_trials, n_pulls)
+
+        # Layer 1: Determine rarity (index into RARITY_KEYS) for every pull at once
+        rarity_idx = np.empty(shape, dtype=np.int32)
+        if n_pulls == 1:
+            rarity_idx[:] = self.sampler.rarity_table.sample_array(rng, n_trials).reshape(shape)
+        else:
+            guaranteed = np.zeros(n_pulls, dtype=bool)
+            guaranteed[9::10] = True
+            normal_count = n_trials * int((~guaranteed).sum())
+            rarity_idx[:, ~guaranteed] = self.sampler.rarity_table.sample_array(rng, normal_count).reshape(n_trials, -1)
+            rarity_idx[:, guaranteed] = self.sampler.guaranteed_rarity_table.sample_array(rng, n_trials * n_pulls // 10).reshape(n_trials, -1)
+
+        # Layer 2: Choose students from each rarity pool
+        student_ids = np.empty(shape, dtype=np.int32)
+        for index, rarity in enumerate(RARITY_KEYS):
+            mask = rarity_idx == index
+            count = int(mask.sum())
+            if not count:
+                continue
+            pool = self.sampler.pools[rarity]
+            if pool is None:
+                raise Exception(f"Gacha Error: {rarity.upper()} Pool is empty.")
+            student_ids[mask] = pool.sample_array(rng, count)
+
+        rarities = (len(RARITY_KEYS) - rarity_idx).astype(np.int8)
+        return SimulationResult(student_ids=student_ids, rarities=rarities)
@@ -2,7 +2,7 @@ import threading
 import time
 import sys
 import queue
-from typing import Any, Callable, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 
 class Task:
     """Thread-safe task container."""
@@ -15,14 +15,22 @@ class Task:
         self._error = None
         self._lock = threading.Lock()
         self._done = threading.Event()
+
+        # Timestamps (perf_counter) for queue wait and run latency
+        self.submitted_at = time.perf_counter()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
     
     def execute(self):
         """Execute the task and store result."""
+        self.started_at = time.perf_counter()
         try:
             result = self.func(*self.args, **self.kwargs)
             self.set_result(result)
         except Exception as e:
             self.set_error(e)
+        finally:
+            self.finished_at = time.perf_counter()
     
     def set_result(self, value: Any):
         with self._lock:
@@ -56,26 +64,56 @@ class Task:
         """Wait for task to finish. Returns True if completed."""
         return self._done.wait(timeout)
 
+    @property
+    def wait_time(self) -> Optional[float]:
+        """Seconds spent in the queue before a worker picked the task up."""
+        if self.started_at is None:
+            return None
+        return self.started_at - self.submitted_at
+
+    @property
+    def run_time(self) -> Optional[float]:
+        """Seconds spent executing the task."""
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
 
 class ThreadManager:
     """
     Lightweight thread pool with instant Ctrl+C response.
     Uses daemon threads for clean interruption.
+
+    `max_queue_size` bounds the number of waiting tasks (0 = unbounded).
+    Long-lived pools should pass `track_tasks=False`, so finished tasks are
+    not kept around for `get_results`.
     """
     
-    def __init__(self, max_workers: int = 4):
+    def __init__(self, max_workers: int = 4, max_queue_size: int = 0, track_tasks: bool = True, name: str = "Worker"):
         self.max_workers = max_workers
-        self.task_queue = queue.Queue()
+        self.max_queue_size = max_queue_size
+        self.track_tasks = track_tasks
+        self.task_queue = queue.Queue(maxsize=max_queue_size)
         self._tasks = []
         self._tasks_lock = threading.Lock()
         self._workers = []
+
+        # Latency counters (seconds), updated by the workers
+        self._stats_lock = threading.Lock()
+        self._submitted = 0
+        self._rejected = 0
+        self._completed = 0
+        self._failed = 0
+        self._total_wait = 0.0
+        self._total_run = 0.0
+        self._max_run = 0.0
         
         # Start daemon workers immediately
         for i in range(max_workers):
             worker = threading.Thread(
                 target=self._worker_loop,
                 args=(i,),
-                name=f"Worker-{i}",
+                name=f"{name}-{i}",
                 daemon=True  # KEY: Makes Ctrl+C instant
             )
             worker.start()
@@ -99,17 +137,53 @@ class ThreadManager:
                 # Catch any unexpected errors
                 print(f"Worker {worker_id} unexpected error: {e}", file=sys.stderr)
             finally:
+                self._record(task)
                 self.task_queue.task_done()
+
+    def _record(self, task: Task):
+        """Adds a finished task to the latency counters."""
+        with self._stats_lock:
+            self._completed += 1
+            if task.error is not None:
+                self._failed += 1
+            self._total_wait += task.wait_time or 0.0
+            self._total_run += task.run_time or 0.0
+            self._max_run = max(self._max_run, task.run_time or 0.0)
     
     def submit(self, func: Callable, *args, **kwargs) -> Task:
-        """Submit a task for execution."""
+        """Submit a task for execution. Blocks while a bounded queue is full."""
         task = Task(func, args, kwargs)
-        
-        with self._tasks_lock:
-            self._tasks.append(task)
-        
+        self._track(task)
         self.task_queue.put(task)
         return task
+
+    def try_submit(self, func: Callable, *args, **kwargs) -> Optional[Task]:
+        """Submit a task without blocking. Returns None if the queue is full."""
+        task = Task(func, args, kwargs)
+        # Counted before it is queued, so a worker never completes a task that is not submitted yet
+        self._track(task)
+        try:
+            self.task_queue.put_nowait(task)
+        except queue.Full:
+            self._untrack(task)
+            with self._stats_lock:
+                self._rejected += 1
+            return None
+        return task
+
+    def _track(self, task: Task):
+        with self._stats_lock:
+            self._submitted += 1
+        if self.track_tasks:
+            with self._tasks_lock:
+                self._tasks.append(task)
+
+    def _untrack(self, task: Task):
+        with self._stats_lock:
+            self._submitted -= 1
+        if self.track_tasks:
+            with self._tasks_lock:
+                self._tasks.remove(task)
     
     def wait_completion(self, check_interval: float = 0.1) -> List[Any]:
         """
@@ -145,4 +219,38 @@ class ThreadManager:
     @property
     def active_count(self) -> int:
         """Get number of active worker threads."""
-        return sum(1 for w in self._workers if w.is_alive())
\ No newline at end of file
+        return sum(1 for w in self._workers if w.is_alive())
+
+    @property
+    def queue_depth(self) -> int:
+        """Get number of tasks waiting for a worker."""
+        return self.task_queue.qsize()
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of the queue depth and task latency counters (milliseconds)."""
+        with self._stats_lock:
+            completed = self._completed
+            return {
+                "workers": self.active_count,
+                "queue_depth": self.queue_depth,
+                "max_queue_size": self.max_queue_size,
+                "submitted": self._submitted,
+                "rejected": self._rejected,
+                "completed": completed,
+                "failed": self._failed,
+                "avg_wait_ms": round(self._total_wait / completed * 1000, 2) if completed else 0.0,
+                "avg_run_ms": round(self._total_run / completed * 1000, 2) if completed else 0.0,
+                "max_run_ms": round(self._max_run * 1000, 2),
+            }
+
+    def shutdown(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until every queued task has finished, up to `timeout` seconds.
+        Returns True if the queue was drained.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.task_queue.unfinished_tasks > 0:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
\ No newline at end of file
@@ -0,0 +1,156 @@
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Set
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from .AchievementEngine import ACHIEVEMENT_REGISTRY, AchievementDefinition, AchievementEngine
+from .cache import bump_user_generation, get_cache
+from .database import SessionLocal
+from .metrics import Gauge, REGISTRY
+from .models import UnlockAchievement, User
+from .ThreadManager import ThreadManager
+
+LOGGER = logging.getLogger(__name__)
+
+_pool: Optional[ThreadManager] = None
+_pool_lock = threading.Lock()
+
+def is_async_mode() -> bool:
+    return settings.ACHIEVEMENT_MODE.lower() == "async"
+
+def get_achievement_pool() -> Optional[ThreadManager]:
+    """The background worker pool, created on first use. None in sync mode."""
+    global _pool
+    if not is_async_mode():
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadManager(
+                    max_workers=settings.ACHIEVEMENT_WORKERS,
+                    max_queue_size=settings.ACHIEVEMENT_QUEUE_SIZE,
+                    track_tasks=False,
+                    name="AchievementWorker"
+                )
+                LOGGER.info(f"Achievement worker pool started ({settings.ACHIEVEMENT_WORKERS} workers, queue size {settings.ACHIEVEMENT_QUEUE_SIZE}).")
+    return _pool
+
+def shutdown_achievement_pool(timeout: float = 10.0) -> None:
+    """Gives queued checks a chance to finish before the process exits."""
+    if _pool is not None and not _pool.shutdown(timeout):
+        LOGGER.warning(f"Achievement queue not drained on shutdown: {_pool.stats()}")
+
+# Queue depth, task counts and latency of this worker's pool, read when /metrics is scraped (empty in sync mode)
+def _pool_gauge(fields: Dict[str, str], scale: float = 1.0) -> Callable[[], Dict[tuple, float]]:
+    def collect() -> Dict[tuple, float]:
+        if _pool is None:
+            return {}
+        stats = _pool.stats()
+        return {(label,): stats[field] * scale if scale != 1.0 else stats[field] for label, field in fields.items()}
+    return collect
+
+REGISTRY.register(Gauge(
+    "achievement_queue_depth", "Achievement checks waiting for a worker.", (),
+    lambda: {(): _pool.queue_depth} if _pool is not None else {},
+))
+REGISTRY.register(Gauge(
+    "achievement_tasks", "Achievement checks since startup by state.", ("state",),
+    _pool_gauge({state: state for state in ("submitted", "rejected", "completed", "failed")}),
+))
+REGISTRY.register(Gauge(
+    "achievement_task_seconds", "Achievement check latency since startup (queue wait and run time).", ("stat",),
+    _pool_gauge({"avg_wait": "avg_wait_ms", "avg_run": "avg_run_ms", "max_run": "max_run_ms"}, scale=0.001),
+))
+
+def evaluate_pull_achievements(
+    user_id: int,
+    max_r3_per_pull: int,
+    initial_pull_count: int,
+    pull_amount: int,
+    new_student_ids: Set[int],
+) -> List[str]:
+    """
+    Worker task: checks the achievements of an already committed pull in its own
+    session. Unlocks are stored as not notified, to be delivered by the next
+    pull response or /dashboard/achievements/pending. Returns the unlocked keys.
+    """
+    # Nothing reads the task's error (track_tasks=False): log it here or the unlock is lost silently
+    try:
+        return _unlock_pull_achievements(user_id, max_r3_per_pull, initial_pull_count, pull_amount, new_student_ids)
+    except Exception:
+        LOGGER.exception(f"Achievement check for user {user_id} failed.")
+        raise
+
+def _unlock_pull_achievements(
+    user_id: int,
+    max_r3_per_pull: int,
+    initial_pull_count: int,
+    pull_amount: int,
+    new_student_ids: Set[int],
+) -> List[str]:
+    # Two checks for the same user can race on `_user_achievement_uc`; the loser retries once against the new unlocks.
+    for _ in range(2):
+        with SessionLocal() as db:
+            user = db.get(User, user_id)
+            if user is None:
+                return []
+
+            ach_engine = AchievementEngine(user=user, db=db, notified=False)
+            unlocked = ach_engine.check_pull_achievements(max_r3_per_pull, initial_pull_count, pull_amount, new_student_ids)
+            if not unlocked:
+                return []
+            try:
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+                continue
+
+        bump_user_generation(get_cache(), user_id)
+        return [ach.key for ach in unlocked]
+
+    LOGGER.warning(f"Achievement check for user {user_id} gave up after repeated unlock conflicts.")
+    return []
+
+def submit_pull_achievements(
+    user_id: int,
+    max_r3_per_pull: int,
+    initial_pull_count: int,
+    pull_amount: int,
+    new_student_ids: Set[int],
+) -> bool:
+    """Queues an achievement check. Returns False if the caller must check synchronously instead."""
+    pool = get_achievement_pool()
+    if pool is None:
+        return False
+
+    task = pool.try_submit(evaluate_pull_achievements, user_id, max_r3_per_pull, initial_pull_count, pull_amount, set(new_student_ids))
+    if task is None:
+        LOGGER.warning(f"Achievement queue is full ({pool.queue_depth} waiting). Checking synchronously.")
+        return False
+
+    if settings.DEBUG_MODE:
+        LOGGER.debug(f"Achievement check queued for user {user_id}: {pool.stats()}")
+    return True
+
+def pop_pending_achievements(db: Session, user_id: int) -> List[AchievementDefinition]:
+    """
+    Returns the background unlocks the user has not seen yet and marks them as
+    notified. The caller commits.
+    """
+    pending = (
+        db.query(UnlockAchievement.id, UnlockAchievement.achievement_id)
+        .filter(UnlockAchievement.user_id == user_id, UnlockAchievement.is_notified.is_(False))
+        .order_by(UnlockAchievement.id)
+        .all()
+    )
+    if not pending:
+        return []
+
+    db.query(UnlockAchievement).filter(
+        UnlockAchievement.id.in_([unlock_id for unlock_id, _ in pending])
+    ).update({UnlockAchievement.is_notified: True}, synchronize_session=False)
+
+    definitions = ACHIEVEMENT_REGISTRY.get(db).by_id
+    return [definitions[ach_id] for _, ach_id in pending if ach_id in definitions]
@@ -59,7 +59,7 @@ class AdminAuth(AuthenticationBackend):
 def generate_html_student(id:int, im_type:str, size) -> str:
     return f"""
     <a href="/admin/student/details/{id}" title="">
-      <img src="/api/images/student/{id}/{im_type}" width="{size}" style="border-radius: 4px; margin: 2px;">
+      <img src="/api/images/student/{id}/{im_type}?w={size * 2}&amp;format=webp" width="{size}" style="border-radius: 4px; margin: 2px;">
     </a>
     """
 
@@ -86,14 +86,14 @@ class StudentAdmin(ModelView, model=Student):
 
     @staticmethod
     def _format_portrait(model: Student, _, size: int = 40) -> Markup:
-        if model and model.asset:
+        if model and model.asset_id is not None:
             html_string = generate_html_student(model.id, "portrait", size)
             return Markup(html_string)
         return ""
     
     @staticmethod
     def _format_artwork(model: Student, _, size: int = 40) -> Markup:
-        if model and model.asset:
+        if model and model.asset_id is not None:
             html_string = generate_html_student(model.id, "artwork", size)
             return Markup(html_string)
         return ""
@@ -145,7 +145,7 @@ class GachaBannerAdmin(ModelView, model=GachaBanner):
         """
         html_string = ''.join(
             generate_html_student(student.id, "portrait", size)
-            for student in model.pickup_students if student.asset
+            for student in model.pickup_students if student.asset_id is not None
         )
         return Markup(html_string)
     
@@ -157,14 +157,14 @@ class GachaBannerAdmin(ModelView, model=GachaBanner):
         """
         html_string = ''.join(
             generate_html_student(student.id, "portrait", size)
-            for student in model.excluded_students if student.asset
+            for student in model.excluded_students if student.asset_id is not None
         )
         return Markup(html_string)
 
     column_formatters = {
         "banner_image": lambda model, _: Markup(
-            f'<img src="/api/images/banner/{model.id}" width="120">' # Assumes you create this endpoint
-        ) if model.image_data else "",
+            f'<img src="/api/images/banner/{model.id}?w=240&amp;format=webp" width="120">' # Assumes you create this endpoint
+        ) if model.image_sha256 else "",
 
         "Pickups": lambda model, _: GachaBannerAdmin._format_pickups(model, _, size=40),
         "Excludes": lambda model, _: GachaBannerAdmin._format_excluded(model, _, size=40),
@@ -208,10 +208,10 @@ class AchievementAdmin(ModelView, model=Achievement):
 
     @staticmethod
     def _format_icon(model: Achievement, _, size: int = 100) -> Markup:
-        if model and model.image_data:
+        if model and model.image_sha256:
             html_string = (
                 f'<a href="/admin/achievement/details/{model.id}" title="{model}">'
-                f'  <img src="/api/images/achievement/{model.id}" width="{size}" style="border-radius: 4px; margin: 2px;">'
+                f'  <img src="/api/images/achievement/{model.id}?w={size * 2}&amp;format=webp" width="{size}" style="border-radius: 4px; margin: 2px;">'
                 f'</a>'
             )
             return Markup(html_string)
@@ -237,7 +237,7 @@ class UserInventoryAdmin(ModelView, model=UserInventory):
     @staticmethod
     def _format_portrait(model: UserInventory, _, size: int = 40) -> Markup:
         student = model.student
-        if student and student.asset:
+        if student and student.asset_id is not None:
             html_string = generate_html_student(student.id, "portrait", size)
             return Markup(html_string)
         return ""
@@ -256,7 +256,7 @@ class GachaTransactionAdmin(ModelView, model=GachaTransaction):
     @staticmethod
     def _format_portrait(model, _, size: int = 40) -> Markup:
         student = model.student
-        if student and student.asset:
+        if student and student.asset_id is not None:
             html_string = generate_html_student(student.id, "portrait", size)
             return Markup(html_string)
         return ""
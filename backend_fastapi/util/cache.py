@@ -1,11 +1,19 @@
 import fnmatch
-import json
 import redis
 import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
 from ..config import settings
 from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+from fastapi.responses import Response
+from .codec import Codec, get_codec
+from .invalidation import Event, InvalidationBus, get_invalidation_bus
+from .metrics import CACHE_DELETES, CACHE_EVICTIONS, CACHE_LATENCY, CACHE_REQUESTS, CACHE_SETS, Gauge, REGISTRY
 
-CACHE_TYPE = settings.CACHE_TYPE.lower() # redis or memory
+CACHE_TYPE = settings.CACHE_TYPE.lower() # redis, tiered or memory
 LOGGER = logging.getLogger(__name__)
 REDIS_URL = settings.REDIS_URL
 
@@ -14,6 +22,11 @@ class Cache(ABC):
     def get(self, key: str):
         pass
 
+    @abstractmethod
+    def get_raw(self, key: str) -> Optional[bytes]:
+        """The cached value as a JSON document, to be sent as a response body without decoding."""
+        pass
+
     @abstractmethod
     def set(self, key: str, value, expire: int):
         pass
@@ -26,65 +39,561 @@ class Cache(ABC):
     def delete_by_pattern(self, pattern: str):
         pass
 
+    @abstractmethod
+    def incr(self, key: str) -> int:
+        """Atomically increments a counter (missing = 0) and returns the new value."""
+        pass
+
+    @abstractmethod
+    def get_counter(self, key: str) -> int:
+        pass
+
+    # Batched access. Backends with a network round trip per call override these.
+    def get_many(self, keys: Sequence[str], raw: bool = False) -> List[Optional[Any]]:
+        """Values of `keys` in order, None for misses. With `raw=True` they are JSON documents like `get_raw`."""
+        return [self.get_raw(key) if raw else self.get(key) for key in keys]
+
+    def set_many(self, items: Dict[str, Any], expire: Union[int, Dict[str, int]] = 300) -> None:
+        """Writes several keys in one round trip. `expire` is one TTL for all, or a TTL per key."""
+        for key, value in items.items():
+            self.set(key, value, expire=_expire_for(expire, key))
+
+    # Cross-process locks. Single-process backends have nothing to coordinate with, so they always succeed.
+    def try_lock(self, key: str, ttl: float) -> Optional[str]:
+        """Takes `lock:{key}` for at most `ttl` seconds. Returns a token for `unlock`, or None if it is held elsewhere."""
+        return "local"
+
+    def unlock(self, key: str, token: str) -> None:
+        pass
+
+    def memory_stats(self) -> Dict[str, Dict[str, int]]:
+        """`_LRUStore.stats()` of every in-process store, by store name."""
+        return {}
+
+def _expire_for(expire: Union[int, Dict[str, int]], key: str) -> int:
+    return expire[key] if isinstance(expire, dict) else expire
+
+# Suffix of the freshness markers written next to values by cache_aside
+FRESH_SUFFIX = ":fresh"
+
+def key_namespace(key: str) -> str:
+    """`dashboard:collection:1` -> `dashboard`, `all_banners` -> `all_banners`."""
+    return key.split(":", 1)[0]
+
+class _LRUStore:
+    """
+    Thread-safe key/value store with per-entry TTL and least-recently-used
+    eviction once `max_entries` or `max_bytes` is exceeded (0 = unbounded).
+    Expired entries are dropped when read, or when they reach the LRU head.
+    """
+    def __init__(self, max_entries: int = 0, max_bytes: int = 0, name: str = "memory"):
+        self.name = name # Store label of the eviction metrics
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[str, tuple]" = OrderedDict() # key -> (value, expires_at or None, size)
+        self._lock = threading.Lock()
+        self.size_bytes = 0
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _pop(self, key: str) -> None:
+        _, _, size = self._data.pop(key)
+        self.size_bytes -= size
+
+    def _is_expired(self, expires_at: Optional[float], now: float) -> bool:
+        return expires_at is not None and expires_at <= now
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            value, expires_at, _ = item
+            if self._is_expired(expires_at, time.monotonic()):
+                self._pop(key)
+                self.expirations += 1
+                CACHE_EVICTIONS.inc(self.name, key_namespace(key), "expired")
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any, expire: Optional[int] = None, size: int = 0) -> None:
+        if self.max_bytes and size > self.max_bytes:
+            LOGGER.debug(f"Not caching '{key}' in memory: {size} bytes exceeds the {self.max_bytes} byte budget")
+            self.delete(key)
+            return
+
+        expires_at = time.monotonic() + expire if expire else None
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+            self._data[key] = (value, expires_at, size)
+            self.size_bytes += size
+            self._evict()
+
+    def _evict(self) -> None:
+        # Only the LRU head is dropped, expired or not: O(1) per entry under the lock, no scan
+        now = time.monotonic()
+        while self._over_budget():
+            key, (_, expires_at, _) = next(iter(self._data.items()))
+            self._pop(key)
+            if self._is_expired(expires_at, now):
+                self.expirations += 1
+                CACHE_EVICTIONS.inc(self.name, key_namespace(key), "expired")
+            else:
+                self.evictions += 1
+                CACHE_EVICTIONS.inc(self.name, key_namespace(key), "lru")
+
+    def _over_budget(self) -> bool:
+        return (
+            (self.max_entries and len(self._data) > self.max_entries)
+            or (self.max_bytes and self.size_bytes > self.max_bytes)
+        )
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+
+    def delete_by_pattern(self, pattern: str) -> int:
+        with self._lock:
+            keys_to_delete = [k for k in self._data if fnmatch.fnmatch(k, pattern)]
+            for key in keys_to_delete:
+                self._pop(key)
+            return len(keys_to_delete)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.size_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "bytes": self.size_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def __len__(self) -> int:
+        return len(self._data)
+
 class InMemoryCache(Cache):
-    def __init__(self):
-        self._cache = {}
-        LOGGER.debug("✅ Using In-Memory Cache (for development)")
+    """
+    Process-local cache of encoded values. Honours `expire` and evicts the least
+    recently used entries beyond CACHE_MEMORY_MAX_ENTRIES / CACHE_MEMORY_MAX_BYTES
+    (size measured as the length of the encoded value).
+    """
+    def __init__(self, max_entries: int = 0, max_bytes: int = 0, codec: Optional[Codec] = None):
+        self.codec = codec or get_codec("json")
+        self._cache = _LRUStore(max_entries=max_entries, max_bytes=max_bytes)
+        # Counters are kept out of the LRU: an evicted generation would reset and could resurrect stale entries
+        self._counters: Dict[str, int] = {}
+        self._counters_lock = threading.Lock()
+        LOGGER.debug(f"✅ Using In-Memory Cache (max {max_entries or 'unlimited'} entries, {max_bytes or 'unlimited'} bytes)")
 
     def get(self, key: str):
         value = self._cache.get(key)
-        if value: return json.loads(value)
+        if value: return self.codec.decode(value)
+        return None
+
+    def get_raw(self, key: str) -> Optional[bytes]:
+        value = self._cache.get(key)
+        if value: return self.codec.to_json(value)
         return None
 
     def set(self, key: str, value, expire: int = 300):
-        self._cache[key] = json.dumps(value, default=str)
+        encoded = self.codec.encode(value)
+        self._cache.set(key, encoded, expire, size=len(encoded))
 
     def delete(self, key: str):
-        if key in self._cache: del self._cache[key]
+        self._cache.delete(key)
+        get_invalidation_bus().publish({"op": "delete", "key": key})
     
     def delete_by_pattern(self, pattern: str):
-        keys_to_delete = [k for k in self._cache if fnmatch.fnmatch(k, pattern)]
-        LOGGER.debug(f"In-Memory Cache: Deleting {len(keys_to_delete)} keys matching '{pattern}'")
-        for key in keys_to_delete:
-            del self._cache[key]
+        deleted = self._cache.delete_by_pattern(pattern)
+        LOGGER.debug(f"In-Memory Cache: Deleting {deleted} keys matching '{pattern}'")
+        get_invalidation_bus().publish({"op": "delete_by_pattern", "pattern": pattern})
+
+    def incr(self, key: str) -> int:
+        with self._counters_lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def get_counter(self, key: str) -> int:
+        return self._counters.get(key, 0)
+
+    def stats(self) -> Dict[str, int]:
+        """Entry count, stored bytes and hit / miss / eviction / expiry counters."""
+        return self._cache.stats()
+
+    def memory_stats(self) -> Dict[str, Dict[str, int]]:
+        return {self._cache.name: self._cache.stats()}
 
 class RedisCache(Cache):
-    def __init__(self):
-        self.redis_client = redis.from_url(
-            REDIS_URL,
-            decode_responses=True # Decode from bytes to string
-        )
-        LOGGER.debug("🚀 Using Redis Cache (for production)")
+    def __init__(self, codec: Optional[Codec] = None):
+        self.codec = codec or get_codec("json")
+        self.redis_client = redis.from_url(REDIS_URL) # Values are the codec's bytes
+        LOGGER.debug(f"🚀 Using Redis Cache (for production, {self.codec.name} codec)")
+
+    def _decode(self, key: str, value: bytes, default=None):
+        try:
+            return self.codec.decode(value)
+        except Exception as e:
+            # e.g. written with another codec before CACHE_CODEC changed: treat as a miss
+            LOGGER.warning(f"Redis Cache: Could not decode '{key}' ({e}). Treating it as a miss.")
+            return default
 
     def get(self, key: str):
         value = self.redis_client.get(key)
-        if value: return json.loads(value)
+        if value: return self._decode(key, value)
         return None
 
+    def _to_json(self, key: str, value: bytes) -> Optional[bytes]:
+        try:
+            return self.codec.to_json(value)
+        except Exception as e:
+            LOGGER.warning(f"Redis Cache: Could not decode '{key}' ({e}). Treating it as a miss.")
+            return None
+
+    def get_raw(self, key: str) -> Optional[bytes]:
+        value = self.redis_client.get(key)
+        if not value:
+            return None
+        return self._to_json(key, value)
+
     def set(self, key: str, value, expire: int = 300):
-        self.redis_client.set(key, json.dumps(value, default=str), ex=expire)
+        self.redis_client.set(key, self.codec.encode(value), ex=expire)
+
+    # One MGET / one pipelined round trip for the whole batch
+    def get_many(self, keys: Sequence[str], raw: bool = False) -> List[Optional[Any]]:
+        if not keys:
+            return []
+        convert = self._to_json if raw else self._decode
+        return [convert(key, value) if value else None for key, value in zip(keys, self.redis_client.mget(keys))]
+
+    def set_many(self, items: Dict[str, Any], expire: Union[int, Dict[str, int]] = 300) -> None:
+        if not items:
+            return
+        pipe = self.redis_client.pipeline(transaction=False)
+        for key, value in items.items():
+            pipe.set(key, self.codec.encode(value), ex=_expire_for(expire, key))
+        pipe.execute()
         
     def delete(self, key: str):
         self.redis_client.delete(key)
+        get_invalidation_bus().publish({"op": "delete", "key": key})
     
     def delete_by_pattern(self, pattern: str):
         keys_to_delete = [key for key in self.redis_client.scan_iter(match=pattern)]
         if keys_to_delete:
             LOGGER.debug(f"Redis Cache: Deleting {len(keys_to_delete)} keys matching '{pattern}'")
             self.redis_client.delete(*keys_to_delete)
+        get_invalidation_bus().publish({"op": "delete_by_pattern", "pattern": pattern})
+
+    def incr(self, key: str) -> int:
+        return self.redis_client.incr(key)
+
+    def get_counter(self, key: str) -> int:
+        return int(self.redis_client.get(key) or 0)
+
+    # Deletes the lock only if it still holds our token (it may have expired and been taken by another worker)
+    _UNLOCK_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+
+    def try_lock(self, key: str, ttl: float) -> Optional[str]:
+        token = uuid.uuid4().hex
+        if self.redis_client.set(f"lock:{key}", token, nx=True, px=int(ttl * 1000)):
+            return token
+        return None
+
+    def unlock(self, key: str, token: str) -> None:
+        self.redis_client.eval(self._UNLOCK_SCRIPT, 1, f"lock:{key}", token)
+
+# A cached JSON `null` decodes to None, so decode failures need their own marker
+_UNDECODABLE = object()
+
+class TieredCache(Cache):
+    """
+    Redis behind an in-process L1 for the namespaces in CACHE_L1_NAMESPACES.
+    Each of those namespaces gets its own bounded LRU and TTL; an L1 hit skips
+    the network round trip and the decode. Other namespaces go straight to Redis.
+    Deletes made by other workers arrive through the invalidation bus.
+    """
+    def __init__(self, l2: RedisCache, namespaces: Dict[str, tuple], bus: Optional[InvalidationBus] = None):
+        self.l2 = l2
+        self.codec = l2.codec
+        self._l1: Dict[str, _LRUStore] = {}
+        self._l1_ttl: Dict[str, int] = {}
+        for namespace, (max_entries, ttl) in namespaces.items():
+            self._l1[namespace] = _LRUStore(max_entries=max_entries, name=f"l1:{namespace}")
+            self._l1_ttl[namespace] = ttl
+        (bus or get_invalidation_bus()).subscribe(self._on_invalidation)
+        LOGGER.debug(f"🚀 Using Tiered Cache (in-process L1 for {sorted(self._l1)} + Redis)")
+
+    def _on_invalidation(self, event: Event) -> None:
+        op = event.get("op")
+        if op == "delete":
+            l1 = self._l1_for(event["key"])
+            if l1 is not None:
+                l1.delete(event["key"])
+        elif op == "delete_by_pattern":
+            for l1 in self._l1.values():
+                l1.delete_by_pattern(event["pattern"])
+        elif op == "reset":
+            for l1 in self._l1.values():
+                l1.clear()
+
+    def _l1_for(self, key: str) -> Optional[_LRUStore]:
+        return self._l1.get(key_namespace(key))
+
+    def _l1_expire(self, key: str, expire: Optional[int] = None) -> int:
+        ttl = self._l1_ttl[key_namespace(key)]
+        return min(ttl, expire) if expire else ttl
+
+    # L1 entries are (decoded value, encoded bytes), so both get() and get_raw() skip the codec
+    def _get_l1_entry(self, l1: _LRUStore, key: str) -> Optional[tuple]:
+        entry = l1.get(key)
+        if entry is not None:
+            return entry
+
+        encoded = self.l2.redis_client.get(key)
+        if not encoded:
+            return None
+        value = self.l2._decode(key, encoded, default=_UNDECODABLE)
+        if value is _UNDECODABLE:
+            return None
+        entry = (value, encoded)
+        l1.set(key, entry, self._l1_expire(key))
+        return entry
+
+    def get(self, key: str):
+        l1 = self._l1_for(key)
+        if l1 is None:
+            return self.l2.get(key)
+
+        entry = self._get_l1_entry(l1, key)
+        return entry[0] if entry else None
+
+    def get_raw(self, key: str) -> Optional[bytes]:
+        l1 = self._l1_for(key)
+        if l1 is None:
+            return self.l2.get_raw(key)
+
+        entry = self._get_l1_entry(l1, key)
+        return self.codec.to_json(entry[1]) if entry else None
+
+    def set(self, key: str, value, expire: int = 300):
+        encoded = self.codec.encode(value)
+        self.l2.redis_client.set(key, encoded, ex=expire)
+        l1 = self._l1_for(key)
+        if l1 is not None:
+            # Store what a Redis hit would return, so both tiers give the same shape
+            l1.set(key, (self.codec.decode(encoded), encoded), self._l1_expire(key, expire))
+
+    def get_many(self, keys: Sequence[str], raw: bool = False) -> List[Optional[Any]]:
+        # L1 hits are answered in process, everything else goes out in a single MGET
+        entries: Dict[str, Optional[tuple]] = {}
+        remote = []
+        for key in keys:
+            l1 = self._l1_for(key)
+            entry = l1.get(key) if l1 is not None else None
+            if entry is not None:
+                entries[key] = entry
+            elif key not in remote:
+                remote.append(key)
+
+        if remote:
+            for key, encoded in zip(remote, self.l2.redis_client.mget(remote)):
+                value = self.l2._decode(key, encoded, default=_UNDECODABLE) if encoded else _UNDECODABLE
+                if value is _UNDECODABLE:
+                    entries[key] = None
+                    continue
+                entries[key] = (value, encoded)
+                l1 = self._l1_for(key)
+                if l1 is not None:
+                    l1.set(key, entries[key], self._l1_expire(key))
+
+        if raw:
+            return [self.codec.to_json(entries[key][1]) if entries[key] else None for key in keys]
+        return [entries[key][0] if entries[key] else None for key in keys]
+
+    def set_many(self, items: Dict[str, Any], expire: Union[int, Dict[str, int]] = 300) -> None:
+        if not items:
+            return
+        encoded_items = {key: self.codec.encode(value) for key, value in items.items()}
+        pipe = self.l2.redis_client.pipeline(transaction=False)
+        for key, encoded in encoded_items.items():
+            pipe.set(key, encoded, ex=_expire_for(expire, key))
+        pipe.execute()
+
+        for key, encoded in encoded_items.items():
+            l1 = self._l1_for(key)
+            if l1 is not None:
+                l1.set(key, (self.codec.decode(encoded), encoded), self._l1_expire(key, _expire_for(expire, key)))
+
+    # The L2 delete publishes the event that evicts the other workers' L1
+    def delete(self, key: str):
+        l1 = self._l1_for(key)
+        if l1 is not None:
+            l1.delete(key)
+        self.l2.delete(key)
+
+    def delete_by_pattern(self, pattern: str):
+        for l1 in self._l1.values():
+            l1.delete_by_pattern(pattern)
+        self.l2.delete_by_pattern(pattern)
+
+    # Counters must be shared by all workers, so they always live in Redis
+    def incr(self, key: str) -> int:
+        return self.l2.incr(key)
+
+    def get_counter(self, key: str) -> int:
+        return self.l2.get_counter(key)
+
+    def try_lock(self, key: str, ttl: float) -> Optional[str]:
+        return self.l2.try_lock(key, ttl)
+
+    def unlock(self, key: str, token: str) -> None:
+        self.l2.unlock(key, token)
+
+    def memory_stats(self) -> Dict[str, Dict[str, int]]:
+        return {l1.name: l1.stats() for l1 in self._l1.values()}
+
+class InstrumentedCache(Cache):
+    """
+    Counts hits, misses, sets and deletes and times every call of the wrapped
+    cache, labelled by key namespace. Exposed on `/metrics`.
+    """
+    def __init__(self, inner: Cache):
+        self.inner = inner
+        self.codec = inner.codec
+
+    def _timed(self, op: str, key: str, call: Callable[[], Any]) -> Any:
+        start = time.perf_counter()
+        try:
+            return call()
+        finally:
+            CACHE_LATENCY.observe(time.perf_counter() - start, key_namespace(key), op)
+
+    def _count_read(self, key: str, value) -> None:
+        # A lookup reads the value and its freshness marker; only the value counts
+        if key.endswith(FRESH_SUFFIX):
+            return
+        CACHE_REQUESTS.inc(key_namespace(key), "miss" if value is None else "hit")
+
+    def get(self, key: str):
+        value = self._timed("get", key, lambda: self.inner.get(key))
+        self._count_read(key, value)
+        return value
+
+    def get_raw(self, key: str) -> Optional[bytes]:
+        value = self._timed("get", key, lambda: self.inner.get_raw(key))
+        self._count_read(key, value)
+        return value
+
+    def get_many(self, keys: Sequence[str], raw: bool = False) -> List[Optional[Any]]:
+        if not keys:
+            return []
+        # One round trip, attributed to the namespace of the first key
+        values = self._timed("get_many", keys[0], lambda: self.inner.get_many(keys, raw=raw))
+        for key, value in zip(keys, values):
+            self._count_read(key, value)
+        return values
+
+    def set(self, key: str, value, expire: int = 300):
+        self._timed("set", key, lambda: self.inner.set(key, value, expire=expire))
+        CACHE_SETS.inc(key_namespace(key))
+
+    def set_many(self, items: Dict[str, Any], expire: Union[int, Dict[str, int]] = 300) -> None:
+        if not items:
+            return
+        self._timed("set_many", next(iter(items)), lambda: self.inner.set_many(items, expire=expire))
+        for key in items:
+            if not key.endswith(FRESH_SUFFIX):
+                CACHE_SETS.inc(key_namespace(key))
+
+    def delete(self, key: str):
+        self._timed("delete", key, lambda: self.inner.delete(key))
+        CACHE_DELETES.inc(key_namespace(key))
+
+    def delete_by_pattern(self, pattern: str):
+        self._timed("delete_by_pattern", pattern, lambda: self.inner.delete_by_pattern(pattern))
+        CACHE_DELETES.inc(key_namespace(pattern))
+
+    def incr(self, key: str) -> int:
+        return self._timed("incr", key, lambda: self.inner.incr(key))
+
+    def get_counter(self, key: str) -> int:
+        return self._timed("get_counter", key, lambda: self.inner.get_counter(key))
+
+    def try_lock(self, key: str, ttl: float) -> Optional[str]:
+        return self._timed("lock", key, lambda: self.inner.try_lock(key, ttl))
+
+    def unlock(self, key: str, token: str) -> None:
+        self._timed("unlock", key, lambda: self.inner.unlock(key, token))
+
+    def memory_stats(self) -> Dict[str, Dict[str, int]]:
+        return self.inner.memory_stats()
+
+# --- Per-user generations ---
+# Every per-user key embeds the user's generation. Bumping it (one INCR) makes
+# all of that user's entries unreachable; they then age out by TTL / LRU.
+
+def _user_generation_key(user_id: int) -> str:
+    return f"generation:user:{user_id}"
+
+def get_user_generation(cache: Cache, user_id: int) -> int:
+    return cache.get_counter(_user_generation_key(user_id))
+
+def bump_user_generation(cache: Cache, user_id: int) -> int:
+    """Invalidates every cached entry of one user."""
+    return cache.incr(_user_generation_key(user_id))
+
+def user_cache_key(cache: Cache, name: str, user_id: int, *parts, namespace: str = "dashboard") -> str:
+    """`{namespace}:{name}:{user_id}:g{generation}[:{part}...]`"""
+    key = f"{namespace}:{name}:{user_id}:g{get_user_generation(cache, user_id)}"
+    for part in parts:
+        key += f":{part}"
+    return key
+
+def raw_json_response(body: bytes) -> Response:
+    """Sends a `get_raw` hit as-is: no decode, no response_model validation, no re-encode."""
+    return Response(content=body, media_type="application/json")
 
 def get_cache_client() -> Cache:
     """
     Factory function to decide which cache implementation to use
     based on the CACHE_TYPE environment variable.
     """
+    codec = get_codec(settings.CACHE_CODEC)
     if CACHE_TYPE == "redis":
-        return RedisCache()
-    return InMemoryCache()
+        cache = RedisCache(codec)
+    elif CACHE_TYPE == "tiered":
+        cache = TieredCache(RedisCache(codec), settings.CACHE_L1_NAMESPACES)
+    else:
+        cache = InMemoryCache(max_entries=settings.CACHE_MEMORY_MAX_ENTRIES, max_bytes=settings.CACHE_MEMORY_MAX_BYTES, codec=codec)
+    return InstrumentedCache(cache) if settings.METRICS_ENABLED else cache
 
 # Create a single instance that will be shared across the application
 cache_client: Cache = get_cache_client()
 
+# Size of the in-process stores, read when /metrics is scraped
+def _memory_gauge(field: str) -> Callable[[], Dict[tuple, float]]:
+    return lambda: {(store,): stats[field] for store, stats in cache_client.memory_stats().items()}
+
+REGISTRY.register(Gauge("cache_memory_entries", "Entries held by each in-process cache store.", ("store",), _memory_gauge("entries")))
+REGISTRY.register(Gauge("cache_memory_bytes", "Encoded bytes held by each in-process cache store (0 when not tracked).", ("store",), _memory_gauge("bytes")))
+
 # This is the dependency that our endpoints will use
 def get_cache() -> Cache:
     return cache_client
\ No newline at end of file
@@ -0,0 +1,194 @@
+import functools
+import inspect
+import logging
+import threading
+import time
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+from typing import Any, Callable, Dict, Optional
+from ..config import settings
+from .cache import FRESH_SUFFIX, Cache, raw_json_response, user_cache_key
+
+LOGGER = logging.getLogger(__name__)
+
+# --- Single-flight ---
+# One computation per key and process. Followers wait on the leader's event.
+
+_inflight: Dict[str, threading.Event] = {}
+_inflight_lock = threading.Lock()
+
+def _begin_flight(key: str) -> Optional[threading.Event]:
+    """Returns None if the caller now leads the computation of `key`, else the leader's event."""
+    with _inflight_lock:
+        event = _inflight.get(key)
+        if event is not None:
+            return event
+        _inflight[key] = threading.Event()
+        return None
+
+def _end_flight(key: str) -> None:
+    with _inflight_lock:
+        event = _inflight.pop(key, None)
+    if event is not None:
+        event.set()
+
+# --- Cache-aside ---
+
+def _fresh_key(key: str) -> str:
+    # Set next to the value with the soft TTL; a value without it is stale.
+    # Same namespace as the value, so the tiered cache keeps both in process.
+    return f"{key}{FRESH_SUFFIX}"
+
+def _read(cache: Cache, key: str, raw: bool):
+    return cache.get_raw(key) if raw else cache.get(key)
+
+def _store(cache: Cache, key: str, value: Any, soft_ttl: int, hard_ttl: int, raw: bool):
+    # Value and freshness marker in one round trip (a pipeline on Redis)
+    fresh_key = _fresh_key(key)
+    cache.set_many({key: value, fresh_key: 1}, expire={key: hard_ttl, fresh_key: soft_ttl})
+    if raw:
+        return cache.codec.to_json(cache.codec.encode(value))
+    return value
+
+def _wait_for_value(cache: Cache, key: str, raw: bool, timeout: float):
+    """Polls for a value another worker is computing."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        cached = _read(cache, key, raw)
+        if cached is not None:
+            return cached
+    return None
+
+def _lead(cache: Cache, key: str, compute: Callable[[], Any], soft_ttl: int, hard_ttl: int, raw: bool, stale):
+    """Computes and stores `key` as this process' leader, taking the Redis lock first if enabled."""
+    token = None
+    try:
+        if settings.CACHE_DISTRIBUTED_LOCK:
+            token = cache.try_lock(key, ttl=settings.CACHE_LOCK_TIMEOUT)
+            if token is None:
+                # Another worker is on it: keep serving the stale value, or wait for theirs
+                if stale is not None:
+                    return stale
+                cached = _wait_for_value(cache, key, raw, settings.CACHE_LOCK_TIMEOUT)
+                if cached is not None:
+                    return cached
+
+        if settings.DEBUG_MODE:
+            LOGGER.debug(f"CACHE {'REFRESH' if stale is not None else 'MISS'} for {key}")
+        try:
+            value = compute()
+        except HTTPException:
+            raise # A deliberate response (e.g. 404 once the row is gone), not a failure
+        except Exception:
+            if stale is None:
+                raise
+            # Serve the stale value; the next request after the soft TTL tries again
+            LOGGER.exception(f"Refreshing {key} failed. Serving the stale value.")
+            return stale
+        return _store(cache, key, value, soft_ttl, hard_ttl, raw)
+    finally:
+        if token is not None:
+            cache.unlock(key, token)
+        _end_flight(key)
+
+def get_or_compute(
+    cache: Cache,
+    key: str,
+    compute: Callable[[], Any],
+    soft_ttl: Optional[int] = None,
+    hard_ttl: Optional[int] = None,
+    raw: bool = False,
+):
+    """
+    Cache-aside read with stampede protection and stale-while-revalidate.
+
+    - Fresh (younger than `soft_ttl`): returned as-is.
+    - Stale (older than `soft_ttl`, younger than `hard_ttl`): one request
+      recomputes it, concurrent requests get the stale value meanwhile.
+    - Missing: one request per process (per cluster with CACHE_DISTRIBUTED_LOCK)
+      computes it, the others wait up to CACHE_LOCK_TIMEOUT for its result.
+
+    `compute` returns the JSON-ready value to cache. With `raw=True` the result
+    is the JSON document as bytes (see `raw_json_response`).
+    """
+    soft_ttl = soft_ttl or settings.CACHE_EXPIRE
+    hard_ttl = hard_ttl or soft_ttl + settings.CACHE_STALE_TTL
+
+    # Value and freshness marker in one round trip
+    cached, fresh = cache.get_many([key, _fresh_key(key)], raw=raw)
+    if cached is not None:
+        if fresh is not None:
+            if settings.DEBUG_MODE:
+                LOGGER.debug(f"CACHE HIT for {key}")
+            return cached
+
+        # Stale: whoever gets the flight refreshes, everybody else keeps the old value
+        if _begin_flight(key) is not None:
+            return cached
+        return _lead(cache, key, compute, soft_ttl, hard_ttl, raw, stale=cached)
+
+    event = _begin_flight(key)
+    if event is None:
+        return _lead(cache, key, compute, soft_ttl, hard_ttl, raw, stale=None)
+
+    if event.wait(settings.CACHE_LOCK_TIMEOUT):
+        cached = _read(cache, key, raw)
+        if cached is not None:
+            return cached
+
+    # The leader failed or is too slow: compute without coordination
+    LOGGER.warning(f"Single-flight wait for {key} gave up. Computing it directly.")
+    return _store(cache, key, compute(), soft_ttl, hard_ttl, raw)
+
+# --- Endpoint decorator ---
+
+def to_jsonable(value: Any) -> Any:
+    """Default `@cached` serializer: pydantic models (or lists of them) to their JSON form."""
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, list):
+        return [to_jsonable(item) for item in value]
+    return jsonable_encoder(value)
+
+def cached(
+    key: str,
+    ttl: Optional[int] = None,
+    namespace: Optional[str] = None,
+    serializer: Callable[[Any], Any] = to_jsonable,
+    per_user: bool = False,
+):
+    """
+    Caches a router endpoint through `get_or_compute` and serves hits as raw JSON.
+
+    `key` is formatted with the endpoint's arguments (`"top_students:{rarity}"`)
+    and prefixed with `namespace`. With `per_user=True` it becomes a per-user
+    key (see `user_cache_key`), invalidated by `bump_user_generation`.
+    `serializer` turns the endpoint's return value into the JSON-ready value to
+    cache. Every result is cached, `None` and empty lists included.
+
+    The endpoint must take `cache: Cache = Depends(get_cache)` (and
+    `current_user` when `per_user=True`); its body then only computes the value.
+    """
+    def decorator(func: Callable[..., Any]):
+        params = inspect.signature(func).parameters
+        required = ("cache", "current_user") if per_user else ("cache",)
+        missing = [name for name in required if name not in params]
+        if missing:
+            raise TypeError(f"@cached endpoint '{func.__name__}' needs the parameters {missing}")
+
+        @functools.wraps(func) # FastAPI reads the dependencies from the wrapped signature
+        def wrapper(**kwargs):
+            cache: Cache = kwargs["cache"]
+            name = key.format(**kwargs)
+            if per_user:
+                cache_key = user_cache_key(cache, name, kwargs["current_user"].id, namespace=namespace or "dashboard")
+            else:
+                cache_key = f"{namespace}:{name}" if namespace else name
+
+            body = get_or_compute(cache, cache_key, lambda: serializer(func(**kwargs)), soft_ttl=ttl, raw=True)
+            return raw_json_response(body)
+
+        return wrapper
+    return decorator
@@ -0,0 +1,90 @@
+import logging
+import threading
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .cache import get_cache
+from .invalidation import Event, get_invalidation_bus
+from .models import Achievement, GachaBanner, GachaPreset, ImageAsset, School, Student, Version
+
+LOGGER = logging.getLogger(__name__)
+
+# Content domains and the models whose committed changes make data compiled
+# from that domain stale (banner samplers, student snapshots, achievement registry).
+CATALOG = "catalog"
+ACHIEVEMENTS = "achievements"
+TRACKED_MODELS = {
+    CATALOG: (GachaBanner, GachaPreset, Student, Version, School, ImageAsset),
+    ACHIEVEMENTS: (Achievement,),
+}
+
+# Cache keys built from each domain, deleted after a committed change
+CONTENT_CACHE_KEYS = {
+    CATALOG: ("all_banners", "all_schools"),
+    ACHIEVEMENTS: (),
+}
+CONTENT_CACHE_PATTERNS = {
+    CATALOG: ("image:*", "banner:*", "all_students:*"),
+    ACHIEVEMENTS: ("image:achievement:*",),
+}
+
+_content_versions = {domain: 0 for domain in TRACKED_MODELS}
+_content_lock = threading.Lock()
+
+def get_content_version(domain: str) -> int:
+    """Returns the current in-process content version of a domain."""
+    return _content_versions[domain]
+
+def bump_content_version(domain: str) -> int:
+    """Marks everything compiled from a domain as stale and returns the new version."""
+    with _content_lock:
+        _content_versions[domain] += 1
+        LOGGER.debug(f"Content version of '{domain}' bumped to {_content_versions[domain]}")
+        return _content_versions[domain]
+
+def get_catalog_version() -> int:
+    return get_content_version(CATALOG)
+
+def bump_catalog_version() -> int:
+    return bump_content_version(CATALOG)
+
+# --- Session hooks ---
+# Listening on the Session class covers both the API sessions and the ones
+# SQLAdmin creates for its edit forms.
+
+@event.listens_for(Session, "after_flush")
+def _track_content_changes(session: Session, flush_context) -> None:
+    changed = session.info.setdefault("changed_domains", set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        for domain, models in TRACKED_MODELS.items():
+            if isinstance(obj, models):
+                changed.add(domain)
+
+@event.listens_for(Session, "after_commit")
+def _bump_after_commit(session: Session) -> None:
+    for domain in session.info.pop("changed_domains", ()):
+        bump_content_version(domain)
+        get_invalidation_bus().publish({"op": "content", "domain": domain})
+        try:
+            cache = get_cache()
+            for key in CONTENT_CACHE_KEYS[domain]:
+                cache.delete(key)
+            for pattern in CONTENT_CACHE_PATTERNS[domain]:
+                cache.delete_by_pattern(pattern)
+        except Exception as e:
+            LOGGER.warning(f"Could not clear the cached '{domain}' data: {e}")
+
+@event.listens_for(Session, "after_rollback")
+def _reset_after_rollback(session: Session) -> None:
+    session.info.pop("changed_domains", None)
+
+# --- Changes committed by other workers ---
+
+def _on_invalidation(event: Event) -> None:
+    if event.get("op") == "content" and event.get("domain") in _content_versions:
+        bump_content_version(event["domain"])
+    elif event.get("op") == "reset":
+        for domain in TRACKED_MODELS:
+            bump_content_version(domain)
+
+get_invalidation_bus().subscribe(_on_invalidation)
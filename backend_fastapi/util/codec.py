@@ -0,0 +1,81 @@
+import json
+import logging
+from abc import ABC, abstractmethod
+from typing import Any
+
+try:
+    import orjson
+except ImportError: # Optional, see get_codec
+    orjson = None
+
+try:
+    import msgpack
+except ImportError: # Optional, see get_codec
+    msgpack = None
+
+LOGGER = logging.getLogger(__name__)
+
+class Codec(ABC):
+    """Turns cache values into bytes and back."""
+    name: str
+
+    @abstractmethod
+    def encode(self, value: Any) -> bytes:
+        pass
+
+    @abstractmethod
+    def decode(self, data: bytes) -> Any:
+        pass
+
+    def to_json(self, data: bytes) -> bytes:
+        """
+        The encoded value as a JSON document, so a cache hit can be sent as the
+        response body as-is. JSON codecs return `data` unchanged.
+        """
+        return data
+
+class JsonCodec(Codec):
+    name = "json"
+
+    def encode(self, value: Any) -> bytes:
+        return json.dumps(value, default=str).encode()
+
+    def decode(self, data: bytes) -> Any:
+        return json.loads(data)
+
+class OrjsonCodec(Codec):
+    name = "orjson"
+    OPTIONS = orjson.OPT_NON_STR_KEYS if orjson else 0 # Same int -> str key handling as `json`
+
+    def encode(self, value: Any) -> bytes:
+        return orjson.dumps(value, default=str, option=self.OPTIONS)
+
+    def decode(self, data: bytes) -> Any:
+        return orjson.loads(data)
+
+class MsgpackCodec(Codec):
+    """Smallest payloads, but hits served as raw bytes are re-encoded to JSON."""
+    name = "msgpack"
+
+    def encode(self, value: Any) -> bytes:
+        return msgpack.packb(value, default=str, use_bin_type=True)
+
+    def decode(self, data: bytes) -> Any:
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+    def to_json(self, data: bytes) -> bytes:
+        value = self.decode(data)
+        if orjson:
+            return orjson.dumps(value, default=str, option=OrjsonCodec.OPTIONS)
+        return json.dumps(value, default=str).encode()
+
+def get_codec(name: str) -> Codec:
+    """Codec by name. Falls back to the standard library when the package is not installed."""
+    name = name.lower()
+    if name == "orjson" and orjson:
+        return OrjsonCodec()
+    if name == "msgpack" and msgpack:
+        return MsgpackCodec()
+    if name != "json":
+        LOGGER.warning(f"Cache codec '{name}' is not available. Falling back to 'json'.")
+    return JsonCodec()
@@ -0,0 +1,143 @@
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional
+from ..config import settings
+
+LOGGER = logging.getLogger(__name__)
+
+SHA256_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+VARIANT_NAME_PATTERN = re.compile(r"^(\d+|full)\.(png|jpg|webp)$")
+SPRITE_SLOT_PATTERN = re.compile(r"^[a-z0-9-]+$")
+
+# Magic numbers of the formats we store; anything else is served as octet-stream
+_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+def sniff_mime(data: bytes) -> str:
+    for signature, mime in _SIGNATURES:
+        if data.startswith(signature):
+            return mime
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+@dataclass(frozen=True)
+class StoredImage:
+    sha256: str
+    size: int
+    mime: str
+
+class ImageStore:
+    """
+    Content-addressed image files: `{root}/{sha256[:2]}/{sha256}`. Identical
+    images are stored once, and a file never changes once written, so the
+    hash doubles as the HTTP ETag.
+
+    Renditions derived from an image (see util/image_variants.py) live under
+    `{root}/variants/{sha256[:2]}/{sha256}/{name}`, keyed by the source hash.
+    Sprite sheets live under `{root}/sprites/{slot}/{sha256}.webp`, one current
+    sheet per slot (e.g. `catalog-128`): the most recently stored one.
+    """
+    def __init__(self, root: Path):
+        self.root = root
+
+    def path(self, sha256: str) -> Path:
+        if not SHA256_PATTERN.match(sha256):
+            raise ValueError(f"Not a SHA-256 hex digest: {sha256!r}")
+        return self.root / sha256[:2] / sha256
+
+    def exists(self, sha256: str) -> bool:
+        return self.path(sha256).is_file()
+
+    def variant_path(self, sha256: str, name: str) -> Path:
+        if not VARIANT_NAME_PATTERN.match(name):
+            raise ValueError(f"Not a variant name: {name!r}")
+        return self.root / "variants" / sha256[:2] / self.path(sha256).name / name
+
+    def variant_exists(self, sha256: str, name: str) -> bool:
+        return self.variant_path(sha256, name).is_file()
+
+    def put(self, data: bytes) -> StoredImage:
+        """Writes `data` unless it is already stored. Safe to call from several processes."""
+        image = StoredImage(sha256=hashlib.sha256(data).hexdigest(), size=len(data), mime=sniff_mime(data))
+        path = self.path(image.sha256)
+        if path.is_file():
+            return image
+
+        self._write(path, data)
+        LOGGER.debug(f"Stored image {image.sha256} ({image.size} bytes, {image.mime})")
+        return image
+
+    def sprite_sheet_path(self, slot: str, sha256: str) -> Path:
+        if not SPRITE_SLOT_PATTERN.match(slot):
+            raise ValueError(f"Not a sprite sheet slot: {slot!r}")
+        return self.root / "sprites" / slot / f"{self.path(sha256).name}.webp"
+
+    def put_sprite_sheet(self, slot: str, data: bytes, keep_replaced: float) -> StoredImage:
+        """
+        Stores `data` as the current sheet of `slot`. A replaced sheet is deleted
+        once it has been replaced for `keep_replaced` seconds: responses cached
+        before then may still link to it.
+        """
+        image = StoredImage(sha256=hashlib.sha256(data).hexdigest(), size=len(data), mime=sniff_mime(data))
+        path = self.sprite_sheet_path(slot, image.sha256)
+        try:
+            os.utime(path) # Current again: replaces whatever was stored since
+        except FileNotFoundError:
+            self._write(path, data)
+            LOGGER.debug(f"Stored sprite sheet {slot}/{image.sha256} ({image.size} bytes)")
+
+        # By store time: each sheet was replaced when the next one was stored
+        sheets = []
+        for sheet in path.parent.glob("*.webp"):
+            try:
+                sheets.append((sheet.stat().st_mtime, sheet))
+            except FileNotFoundError: # Deleted by another worker
+                continue
+        sheets.sort()
+        now = time.time()
+        for (_, sheet), (replaced_at, _) in zip(sheets, sheets[1:]):
+            if now - replaced_at > keep_replaced:
+                sheet.unlink(missing_ok=True)
+        return image
+
+    def put_variant(self, sha256: str, name: str, data: bytes) -> Path:
+        """Writes (or replaces) the rendition `name` of the stored image `sha256`."""
+        path = self.variant_path(sha256, name)
+        self._write(path, data)
+        LOGGER.debug(f"Stored variant {name} of {sha256} ({len(data)} bytes)")
+        return path
+
+    @staticmethod
+    def _write(path: Path, data: bytes) -> None:
+        # Write to a temporary file next to the target, then rename: readers never see a partial file
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+def image_columns(prefix: str, image: Optional[StoredImage]) -> Dict[str, Any]:
+    """Model column values of a stored image: `{prefix}_sha256`, `{prefix}_size` and `{prefix}_mime`."""
+    return {
+        f"{prefix}_sha256": image.sha256 if image else None,
+        f"{prefix}_size": image.size if image else None,
+        f"{prefix}_mime": image.mime if image else None,
+    }
+
+# Shared by the API, the seeding script and the migration
+IMAGE_STORE = ImageStore(Path(settings.IMAGE_STORE_DIR))
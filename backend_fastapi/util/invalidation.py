@@ -0,0 +1,121 @@
+import json
+import logging
+import threading
+import time
+import uuid
+import redis
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional
+from ..config import settings
+
+LOGGER = logging.getLogger(__name__)
+
+CHANNEL = "cache:invalidate"
+
+# Event shapes (plain dicts, JSON on the wire):
+#   {"op": "delete", "key": "all_banners"}
+#   {"op": "delete_by_pattern", "pattern": "image:*"}
+#   {"op": "content", "domain": "catalog"}    content version bumped (see catalog.py)
+#   {"op": "reset"}                           events may have been missed, drop every local copy
+Event = Dict[str, Any]
+Handler = Callable[[Event], None]
+
+class InvalidationBus(ABC):
+    """
+    Fans invalidation events out to every worker process, so data held in
+    process (L1 cache entries, compiled samplers, achievement definitions)
+    can be evicted when another worker changes it.
+    """
+    def __init__(self):
+        self._handlers: List[Handler] = []
+        self._handlers_lock = threading.Lock()
+
+    def subscribe(self, handler: Handler) -> None:
+        with self._handlers_lock:
+            self._handlers.append(handler)
+
+    def start(self) -> None:
+        """Starts receiving events from other processes (called from the app lifespan)."""
+        pass
+
+    def _dispatch(self, event: Event) -> None:
+        with self._handlers_lock:
+            handlers = list(self._handlers)
+        for handler in handlers:
+            try:
+                handler(event)
+            except Exception as e:
+                LOGGER.error(f"Invalidation handler {handler!r} failed on {event}: {e}")
+
+    @abstractmethod
+    def publish(self, event: Event) -> None:
+        pass
+
+class LocalInvalidationBus(InvalidationBus):
+    """Single-process loopback: events go straight to this process' handlers."""
+    def __init__(self):
+        super().__init__()
+        LOGGER.debug("✅ Using local invalidation bus (single process)")
+
+    def publish(self, event: Event) -> None:
+        self._dispatch(event)
+
+class RedisInvalidationBus(InvalidationBus):
+    """
+    Redis pub/sub bus. Events published by this process are not redelivered
+    to it (the publisher already evicted its own copies). The listener thread
+    reconnects on errors and dispatches a "reset" event after a reconnect,
+    since events sent while disconnected are lost.
+    """
+    def __init__(self, redis_url: str, channel: str = CHANNEL):
+        super().__init__()
+        self.redis_client = redis.from_url(redis_url, decode_responses=True)
+        self.channel = channel
+        self.origin = uuid.uuid4().hex
+        self._listener: Optional[threading.Thread] = None
+        LOGGER.debug(f"🚀 Using Redis invalidation bus on '{channel}'")
+
+    def publish(self, event: Event) -> None:
+        try:
+            self.redis_client.publish(self.channel, json.dumps({**event, "origin": self.origin}))
+        except redis.RedisError as e:
+            LOGGER.warning(f"Could not publish invalidation {event}: {e}")
+
+    def start(self) -> None:
+        with self._handlers_lock:
+            if self._listener is not None:
+                return
+            self._listener = threading.Thread(target=self._listen, name="InvalidationListener", daemon=True)
+            self._listener.start()
+
+    def _listen(self) -> None:
+        reconnecting = False
+        while True:
+            try:
+                pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                if reconnecting:
+                    self._dispatch({"op": "reset"})
+                    reconnecting = False
+
+                for message in pubsub.listen():
+                    event = json.loads(message["data"])
+                    if event.pop("origin", None) == self.origin:
+                        continue
+                    self._dispatch(event)
+            except Exception as e:
+                LOGGER.warning(f"Invalidation listener disconnected ({e}). Reconnecting in 1s...")
+                reconnecting = True
+                time.sleep(1)
+
+def get_invalidation_bus_client() -> InvalidationBus:
+    """Redis-backed caches share a Redis bus; the in-memory cache uses the loopback."""
+    if settings.CACHE_TYPE.lower() in ("redis", "tiered"):
+        return RedisInvalidationBus(settings.REDIS_URL)
+    return LocalInvalidationBus()
+
+# Create a single instance that will be shared across the application
+invalidation_bus: InvalidationBus = get_invalidation_bus_client()
+
+def get_invalidation_bus() -> InvalidationBus:
+    return invalidation_bus
@@ -0,0 +1,141 @@
+import bisect
+import threading
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Minimal Prometheus text-format metrics (no client library needed).
+# Values are per process: with several workers each one reports its own.
+
+LabelValues = Tuple[str, ...]
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)) + "}"
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def get(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0)
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {value}"
+
+class Histogram:
+    REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    CACHE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = REQUEST_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelValues, List[float]] = {} # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, *label_values: str) -> None:
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += seconds
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = sorted((label_values, list(series)) for label_values, series in self._series.items())
+        bucket_labels = self.labels + ("le",)
+        for label_values, series in items:
+            # Stored per bucket, exposed cumulatively
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield f"{self.name}_bucket{_format_labels(bucket_labels, label_values + (le,))} {cumulative}"
+            yield f"{self.name}_count{_format_labels(self.labels, label_values)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, label_values)} {series[-1]}"
+
+class Gauge:
+    """Read at scrape time from `collect`, which returns {label values: value}."""
+    def __init__(self, name: str, help: str, labels: Sequence[str], collect: Callable[[], Dict[LabelValues, float]]):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.collect = collect
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        for label_values, value in sorted(self.collect().items()):
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {value}"
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+# --- Cache (labelled by key namespace, see cache.key_namespace) ---
+
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    "cache_requests_total", "Cache reads by key namespace and result (hit or miss).", ("namespace", "result"),
+))
+CACHE_SETS = REGISTRY.register(Counter(
+    "cache_sets_total", "Values written to the cache by key namespace.", ("namespace",),
+))
+CACHE_DELETES = REGISTRY.register(Counter(
+    "cache_deletes_total", "Explicit deletes (keys or patterns) by key namespace.", ("namespace",),
+))
+CACHE_EVICTIONS = REGISTRY.register(Counter(
+    "cache_evictions_total", "In-process entries dropped by key namespace and reason (lru or expired).", ("store", "namespace", "reason"),
+))
+CACHE_LATENCY = REGISTRY.register(Histogram(
+    "cache_operation_duration_seconds", "Latency of cache calls by key namespace and operation.", ("namespace", "op"),
+    buckets=Histogram.CACHE_BUCKETS,
+))
+
+# --- HTTP ---
+
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "http_requests_total", "Requests by method, route template and status code.", ("method", "route", "status"),
+))
+HTTP_LATENCY = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "Request latency by method and route template.", ("method", "route"),
+))
+
+def render_metrics() -> str:
+    return REGISTRY.render()
@@ -2,12 +2,20 @@ import datetime
 from sqlalchemy import (
     Column, Integer, String, Boolean, ForeignKey, LargeBinary, Numeric, DateTime, Table, UniqueConstraint, Text
 )
-from sqlalchemy.orm import relationship, Mapped
+from sqlalchemy.orm import deferred, relationship, Mapped
+from sqlalchemy.sql.expression import true
 from sqlalchemy.dialects.mysql import LONGBLOB
 from .database import Base
 from typing import List
 
 BLOB_TYPE = LargeBinary().with_variant(LONGBLOB, "mysql", "mariadb")
+
+# Images live in the content-addressed image store (util/image_store.py); rows keep
+# `*_sha256`, `*_size` and `*_mime`. The BLOB columns only hold images of databases
+# created before the store, until `python -m backend_fastapi.migrate_images` moves them.
+# They are deferred: no query loads them unless it asks for them explicitly.
+SHA256_TYPE = String(64)
+MIME_TYPE = String(32)
 DEFAULT_UTC_NOW = lambda: datetime.datetime.now(datetime.timezone.utc)
 
 # ==============================================================================
@@ -32,6 +40,12 @@ banner_exclude_association = Table('banner_exclude_association', Base.metadata,
     Column('student_id', Integer, ForeignKey('student_table.id'))
 )
 
+# Association table for Achievement <-> Student (for Collection requirements)
+achievement_requirement_association = Table('achievement_requirement_association', Base.metadata,
+    Column('achievement_id', Integer, ForeignKey('achievement_table.id')),
+    Column('student_id', Integer, ForeignKey('student_table.id'))
+)
+
 # ==============================================================================
 # A PLACEHOLDER USER MODEL
 # ==============================================================================
@@ -76,7 +90,10 @@ class School(Base):
     __tablename__ = 'student_school_table'
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(20), unique=True, nullable=False)
-    image_data = Column(BLOB_TYPE, nullable=True)
+    image_data = deferred(Column(BLOB_TYPE, nullable=True)) # Legacy, see SHA256_TYPE
+    image_sha256 = Column(SHA256_TYPE, nullable=True)
+    image_size = Column(Integer, nullable=True)
+    image_mime = Column(MIME_TYPE, nullable=True)
 
     def __str__(self) -> str:
         return self.name
@@ -84,8 +101,14 @@ class School(Base):
 class ImageAsset(Base):
     __tablename__ = 'image_asset_table'
     id = Column(Integer, primary_key=True, index=True)
-    portrait_data = Column(BLOB_TYPE, nullable=True)
-    artwork_data = Column(BLOB_TYPE, nullable=True)
+    portrait_data = deferred(Column(BLOB_TYPE, nullable=True)) # Legacy, see SHA256_TYPE
+    artwork_data = deferred(Column(BLOB_TYPE, nullable=True)) # Legacy, see SHA256_TYPE
+    portrait_sha256 = Column(SHA256_TYPE, nullable=True)
+    portrait_size = Column(Integer, nullable=True)
+    portrait_mime = Column(MIME_TYPE, nullable=True)
+    artwork_sha256 = Column(SHA256_TYPE, nullable=True)
+    artwork_size = Column(Integer, nullable=True)
+    artwork_mime = Column(MIME_TYPE, nullable=True)
     pair_hash = Column(String(64), unique=True, nullable=False)
 
 class Student(Base):
@@ -100,7 +123,8 @@ class Student(Base):
 
     version: Mapped["Version"] = relationship("Version", lazy='selectin')
     school: Mapped["School"] = relationship("School", lazy='selectin')
-    asset: Mapped["ImageAsset"] = relationship("ImageAsset", uselist=False, lazy='joined')
+    # Not joined by default: `asset_id` tells whether there are images, the image routes read ImageAsset themselves
+    asset: Mapped["ImageAsset"] = relationship("ImageAsset", uselist=False, lazy='select')
     
     __table_args__ = (UniqueConstraint('name', 'version_id', name='_student_version_uc'),)
 
@@ -122,7 +146,10 @@ class GachaPreset(Base):
 class GachaBanner(Base):
     __tablename__ = 'gacha_banner_table'
     id = Column(Integer, primary_key=True, index=True)
-    image_data = Column(BLOB_TYPE, nullable=True)
+    image_data = deferred(Column(BLOB_TYPE, nullable=True)) # Legacy, see SHA256_TYPE
+    image_sha256 = Column(SHA256_TYPE, nullable=True)
+    image_size = Column(Integer, nullable=True)
+    image_mime = Column(MIME_TYPE, nullable=True)
     name = Column(String(20), unique=True, nullable=False)
     include_limited = Column(Boolean, default=False)
     preset_id = Column(Integer, ForeignKey('gacha_preset_table.id'), nullable=True)
@@ -162,15 +189,49 @@ class UserInventory(Base):
     
     __table_args__ = (UniqueConstraint('user_id', 'student_id', name='_user_student_uc'),)
 
+class UserStats(Base):
+    """Materialized pull counters per user, updated in the same transaction as each pull."""
+    __tablename__ = 'user_stats_table'
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey('user_table.id'), unique=True, nullable=False)
+    total_pulls = Column(Integer, default=0, nullable=False)
+    r3_count = Column(Integer, default=0, nullable=False)
+    r2_count = Column(Integer, default=0, nullable=False)
+    r1_count = Column(Integer, default=0, nullable=False)
+
+    user: Mapped["User"] = relationship("User", lazy='selectin')
+
+class UserBannerStats(Base):
+    """Materialized pull counters per user and banner."""
+    __tablename__ = 'user_banner_stats_table'
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey('user_table.id'), nullable=False)
+    banner_id = Column(Integer, ForeignKey('gacha_banner_table.id'), nullable=False)
+    total_pulls = Column(Integer, default=0, nullable=False)
+    r3_count = Column(Integer, default=0, nullable=False)
+    r2_count = Column(Integer, default=0, nullable=False)
+    r1_count = Column(Integer, default=0, nullable=False)
+
+    user: Mapped["User"] = relationship("User", lazy='selectin')
+    banner: Mapped["GachaBanner"] = relationship("GachaBanner", lazy='selectin')
+
+    __table_args__ = (UniqueConstraint('user_id', 'banner_id', name='_user_banner_uc'),)
+
 class Achievement(Base):
     __tablename__ = 'achievement_table'
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(255), unique=True, nullable=False)
     description = Column(Text, nullable=True)
-    image_data = Column(BLOB_TYPE, nullable=True)
+    image_data = deferred(Column(BLOB_TYPE, nullable=True)) # Legacy, see SHA256_TYPE
+    image_sha256 = Column(SHA256_TYPE, nullable=True)
+    image_size = Column(Integer, nullable=True)
+    image_mime = Column(MIME_TYPE, nullable=True)
     category = Column(String(20), default='MILESTONE')
     key = Column(String(50), unique=True, nullable=False)
 
+    # Students required by a COLLECTION achievement
+    required_students: Mapped[List["Student"]] = relationship("Student", secondary=achievement_requirement_association)
+
     def __str__(self) -> str:
         return f"{self.name}"
 
@@ -178,6 +239,7 @@ class UnlockAchievement(Base):
     __tablename__ = 'unlock_achievement_table'
     id = Column(Integer, primary_key=True, index=True)
     unlock_on = Column(DateTime, default=DEFAULT_UTC_NOW)
+    is_notified = Column(Boolean, default=True, server_default=true(), nullable=False) # False until an unlock made in the background is shown to the user
     
     user_id = Column(Integer, ForeignKey('user_table.id'))
     achievement_id = Column(Integer, ForeignKey('achievement_table.id'))
@@ -22,4 +22,18 @@ class GachaStudentSchema(BaseModel):
 
 class GachaPullResponse(BaseModel):
     results: List[GachaStudentSchema]
-    unlocked_achievements: List[AchievementResponse]
\ No newline at end of file
+    unlocked_achievements: List[AchievementResponse]
+
+class GachaBatchStudentSchema(BaseModel):
+    student: StudentResponse
+    count: int
+    is_pickup: bool
+    is_new: bool
+
+class GachaBatchResponse(BaseModel):
+    total_pulls: int
+    r3_count: int
+    r2_count: int
+    r1_count: int
+    students: List[GachaBatchStudentSchema] # One entry per distinct student
+    unlocked_achievements: List[AchievementResponse]
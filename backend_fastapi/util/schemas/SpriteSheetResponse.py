@@ -0,0 +1,16 @@
+from pydantic import BaseModel
+from typing import Dict
+
+class SpriteResponse(BaseModel):
+    x: int
+    y: int
+    width: int
+    height: int
+
+# --- Response
+class SpriteSheetResponse(BaseModel):
+    image_url: str
+    width: int
+    height: int
+    tile_width: int
+    sprites: Dict[int, SpriteResponse] # Student id -> position in the sheet
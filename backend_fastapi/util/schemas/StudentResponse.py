@@ -28,7 +28,7 @@ class StudentResponse(StudentSchema):
 def create_student_response(student: Student, request: Request) -> StudentResponse:
     school_response = SchoolResponse.model_validate(student.school)
     school_response.id = student.school.id
-    if student.school.image_data:
+    if student.school.image_sha256:
         school_response.image_url = str(request.url_for('serve_school_image', school_id=student.school.id))
 
     student_response = StudentResponse(
@@ -39,7 +39,7 @@ def create_student_response(student: Student, request: Request) -> StudentRespon
         version=VersionSchema.model_validate(student.version),
         school=school_response
     )
-    if student.asset:
+    if student.asset_id is not None:
         student_response.portrait_url = str(request.url_for('serve_student_image', student_id=student.id, image_type='portrait'))
         student_response.artwork_url = str(request.url_for('serve_student_image', student_id=student.id, image_type='artwork'))
     return student_response
\ No newline at end of file
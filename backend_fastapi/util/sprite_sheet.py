@@ -0,0 +1,73 @@
+import io
+import logging
+import math
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from ..config import settings
+from .image_store import IMAGE_STORE, ImageStore
+from .image_variants import Image, select_rendition
+
+LOGGER = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class Sprite:
+    x: int
+    y: int
+    width: int
+    height: int
+
+@dataclass(frozen=True)
+class SpriteSheet:
+    slot: str
+    sha256: str # Of the WebP sheet, the current one of its slot in the image store
+    width: int
+    height: int
+    tile_width: int
+    sprites: Dict[int, Sprite] # Key (student id) -> position in the sheet
+
+def build_sprite_sheet(
+    slot: str, # What the sheet is for, e.g. `banner-1-128`; a new sheet becomes the slot's current one
+    images: List[Tuple[int, str, str]], # (key, sha256, mime) of each stored image
+    tile_width: int,
+    store: ImageStore = IMAGE_STORE,
+) -> Optional[SpriteSheet]:
+    """
+    Packs the images, scaled to `tile_width`, into one WebP grid (as square as
+    possible, in key order) and stores it as the sheet of `slot`. The same
+    images always give the same sheet, so its hash serves as the ETag. Returns
+    None without Pillow.
+    """
+    if Image is None:
+        return None
+
+    tiles: List[Tuple[int, "Image.Image"]] = []
+    for key, sha256, mime in sorted(images):
+        # Start from the smallest rendition that is at least as wide as the tile
+        rendition = select_rendition(sha256, mime, width=tile_width, store=store)
+        if not rendition.path.is_file():
+            LOGGER.error(f"Image {sha256} is missing from the image store, left out of the sprite sheet")
+            continue
+        with Image.open(rendition.path) as source:
+            tile = source.convert("RGBA")
+        if tile.width != tile_width:
+            height = max(1, round(tile.height * tile_width / tile.width))
+            tile = tile.resize((tile_width, height), Image.LANCZOS, reducing_gap=3.0)
+        tiles.append((key, tile))
+
+    columns = max(1, math.ceil(math.sqrt(len(tiles))))
+    rows = max(1, math.ceil(len(tiles) / columns))
+    row_height = max((tile.height for _, tile in tiles), default=1)
+
+    sheet = Image.new("RGBA", (columns * tile_width, rows * row_height), (0, 0, 0, 0))
+    sprites: Dict[int, Sprite] = {}
+    for index, (key, tile) in enumerate(tiles):
+        x, y = (index % columns) * tile_width, (index // columns) * row_height
+        sheet.paste(tile, (x, y))
+        sprites[key] = Sprite(x=x, y=y, width=tile.width, height=tile.height)
+
+    buffer = io.BytesIO()
+    sheet.save(buffer, "WEBP", quality=settings.IMAGE_VARIANT_WEBP_QUALITY)
+    # Cached sprite responses (IMAGE_CACHE_EXPIRE) may still link to the sheet this one replaces
+    stored = store.put_sprite_sheet(slot, buffer.getvalue(), keep_replaced=settings.IMAGE_CACHE_EXPIRE)
+    return SpriteSheet(slot=slot, sha256=stored.sha256, width=sheet.width, height=sheet.height, tile_width=tile_width, sprites=sprites)
@@ -0,0 +1,25 @@
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+class PhaseTimer:
+    """
+    Collects wall-clock durations of named request phases and renders them
+    as a `Server-Timing` header, so they show up in the browser dev tools.
+    """
+    def __init__(self):
+        self.phases: Dict[str, float] = {} # name -> milliseconds, in execution order
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+    def server_timing(self) -> str:
+        return ", ".join(f"{name};dur={ms:.2f}" for name, ms in self.phases.items())
+
+    def __str__(self) -> str:
+        return " | ".join(f"{name}={ms:.2f}ms" for name, ms in self.phases.items())
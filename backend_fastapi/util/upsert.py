@@ -0,0 +1,65 @@
+from typing import Any, Dict, List, Optional, Sequence
+from sqlalchemy import Table, and_, insert, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+def upsert_increment(
+    db: Session,
+    table: Table,
+    conflict_columns: Sequence[str],
+    rows: List[Dict[str, Any]],
+    increment_columns: Sequence[str],
+    returning: Sequence[str] = (),
+) -> Optional[List[Any]]:
+    """
+    Inserts `rows`, or adds their `increment_columns` values to the existing row
+    on a unique conflict, in one atomic statement:
+
+    - PostgreSQL / SQLite: INSERT ... ON CONFLICT DO UPDATE [RETURNING]
+    - MySQL / MariaDB: INSERT ... ON DUPLICATE KEY UPDATE
+    - Other dialects: an UPDATE per row, then an INSERT of the rows that matched
+      nothing (not atomic against concurrent inserts of the same key)
+
+    Returns the `returning` columns of every affected row, or None when the
+    dialect has no RETURNING for upserts (MySQL/MariaDB, fallback). In that case
+    the caller reads the rows back in the same transaction; the upsert holds the
+    row locks until commit, so the result is equivalent.
+    """
+    dialect = db.get_bind().dialect.name
+    # Rows are locked in key order, so two concurrent upserts over the same keys cannot deadlock
+    rows = sorted(rows, key=lambda row: tuple(row[name] for name in conflict_columns))
+
+    if dialect in ("postgresql", "sqlite"):
+        insert_func = postgresql_insert if dialect == "postgresql" else sqlite_insert
+        stmt = insert_func(table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c[name] for name in conflict_columns],
+            set_={name: table.c[name] + stmt.excluded[name] for name in increment_columns}
+        )
+        if returning:
+            return db.execute(stmt.returning(*(table.c[name] for name in returning))).all()
+        db.execute(stmt)
+        return None
+
+    if dialect in ("mysql", "mariadb"):
+        stmt = mysql_insert(table).values(rows)
+        stmt = stmt.on_duplicate_key_update(
+            {name: table.c[name] + stmt.inserted[name] for name in increment_columns}
+        )
+        db.execute(stmt)
+        return None
+
+    new_rows = []
+    for row in rows:
+        result = db.execute(
+            update(table)
+            .where(and_(*(table.c[name] == row[name] for name in conflict_columns)))
+            .values({name: table.c[name] + row[name] for name in increment_columns})
+        )
+        if result.rowcount == 0:
+            new_rows.append(row)
+    if new_rows:
+        db.execute(insert(table), new_rows)
+    return None
@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from .cache import Cache, get_cache
+from .database import SessionLocal
+from .GachaEngine import SAMPLER_REGISTRY
+from .models import Achievement, GachaBanner, ImageAsset, School, Student, Version
+
+LOGGER = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class WarmupReport:
+    warmed: int
+    failed: int
+    skipped: int # Still pending when the time budget ran out
+    seconds: float
+
+def warmup_paths(db: Session) -> List[str]:
+    """
+    Endpoints whose responses fill the shared caches, most valuable first:
+    the banner and school lists, every banner pool, then the portrait sprite
+    sheets. All of them contain absolute image URLs.
+    """
+    banner_ids = [banner_id for (banner_id,) in db.query(GachaBanner.id).order_by(GachaBanner.id)]
+    paths = ["/api/banners/", "/api/schools/"]
+    paths += [f"/api/banners/{banner_id}/details/" for banner_id in banner_ids]
+
+    # Sprite sheets last: each one resizes and packs its portraits
+    paths += [f"/api/images/sprites/banner/{banner_id}" for banner_id in banner_ids]
+    paths.append("/api/images/sprites/catalog")
+    return paths
+
+def image_metadata(db: Session) -> Dict[str, Dict[str, Any]]:
+    """
+    The `{etag, mime, filename}` entries `serve_image` (routers/images.py) caches
+    for every image, by cache key, read from the image columns in a few queries.
+    """
+    entries: Dict[str, Dict[str, Any]] = {}
+
+    def add(cache_key: str, sha256: str, mime: str, filename: str) -> None:
+        entries[cache_key] = {"etag": sha256, "mime": mime, "filename": filename}
+
+    # Only rows that have an image
+    for banner_id, sha256, mime, name in db.query(GachaBanner.id, GachaBanner.image_sha256, GachaBanner.image_mime, GachaBanner.name).filter(GachaBanner.image_sha256.isnot(None)):
+        add(f"image:banner:{banner_id}", sha256, mime, f"{name}.png")
+    for school_id, sha256, mime, name in db.query(School.id, School.image_sha256, School.image_mime, School.name).filter(School.image_sha256.isnot(None)):
+        add(f"image:school:{school_id}", sha256, mime, f"{name}.png")
+    for achievement_id, sha256, mime, key in db.query(Achievement.id, Achievement.image_sha256, Achievement.image_mime, Achievement.key).filter(Achievement.image_sha256.isnot(None)):
+        add(f"image:achievement:{achievement_id}", sha256, mime, f"{key}.png")
+
+    student_assets = (
+        db.query(
+            Student.id, Student.name, Version.name,
+            ImageAsset.portrait_sha256, ImageAsset.portrait_mime,
+            ImageAsset.artwork_sha256, ImageAsset.artwork_mime,
+        )
+        .join(ImageAsset, Student.asset_id == ImageAsset.id)
+        .join(Version, Student.version_id == Version.id)
+    )
+    for student_id, student_name, version_name, portrait_sha256, portrait_mime, artwork_sha256, artwork_mime in student_assets:
+        for image_type, sha256, mime in (("portrait", portrait_sha256, portrait_mime), ("artwork", artwork_sha256, artwork_mime)):
+            if sha256:
+                add(f"image:student:{student_id}:{image_type}", sha256, mime, f"{student_name}_{version_name}_{image_type}.png")
+    return entries
+
+def warm_up_image_metadata(cache: Cache) -> int:
+    """Caches the `image_metadata` entries directly, without streaming any image. Returns their number."""
+    with SessionLocal() as db:
+        entries = image_metadata(db)
+    if entries:
+        cache.set_many(entries, expire=settings.IMAGE_CACHE_EXPIRE)
+    return len(entries)
+
+def compile_samplers(banner_ids: List[int]) -> None:
+    """Fills this worker's SAMPLER_REGISTRY so the first pull on each banner skips the compile."""
+    with SessionLocal() as db:
+        for banner_id in banner_ids:
+            SAMPLER_REGISTRY.get(banner_id, db)
+
+async def warm_up_cache(
+    app: FastAPI,
+    budget: Optional[float] = None,
+    concurrency: Optional[int] = None,
+    samplers: bool = True,
+) -> WarmupReport:
+    """
+    Caches the image metadata, then requests the `warmup_paths` from `app` in
+    process, `concurrency` at a time, so their responses are computed and
+    cached the same way a client request would. Whatever is not done after
+    `budget` seconds is cancelled and left to the first real request.
+
+    The cached bodies contain absolute image URLs, built from CACHE_WARMUP_BASE_URL;
+    without it only the image metadata (and the samplers) are warmed.
+    """
+    budget = budget if budget is not None else settings.CACHE_WARMUP_BUDGET
+    concurrency = concurrency or settings.CACHE_WARMUP_CONCURRENCY
+    start = time.perf_counter()
+
+    with SessionLocal() as db:
+        banner_ids = [banner_id for (banner_id,) in db.query(GachaBanner.id)]
+        paths = warmup_paths(db)
+    if not settings.CACHE_WARMUP_BASE_URL:
+        LOGGER.info("CACHE_WARMUP_BASE_URL is not set: responses with image URLs are left to the first requests")
+        paths = []
+
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url=settings.CACHE_WARMUP_BASE_URL or "http://warmup") as client:
+
+        async def fetch(path: str) -> bool:
+            async with semaphore:
+                try:
+                    response = await client.get(path)
+                except Exception as e:
+                    LOGGER.warning(f"Cache warm-up of {path} failed: {e}")
+                    return False
+            if response.status_code >= 400:
+                LOGGER.warning(f"Cache warm-up of {path} returned {response.status_code}")
+                return False
+            return True
+
+        # Created in priority order, so they take the semaphore in that order
+        tasks = [asyncio.create_task(asyncio.to_thread(warm_up_image_metadata, get_cache()))]
+        tasks += [asyncio.create_task(fetch(path)) for path in paths]
+        if samplers:
+            tasks.append(asyncio.create_task(asyncio.to_thread(compile_samplers, banner_ids)))
+
+        done, pending = await asyncio.wait(tasks, timeout=budget) if tasks else (set(), set())
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    failed = sum(1 for task in done if task.exception() is not None or task.result() is False)
+    for task in done:
+        if task.exception() is not None:
+            LOGGER.warning(f"Cache warm-up step failed: {task.exception()}")
+    report = WarmupReport(
+        warmed=len(done) - failed,
+        failed=failed,
+        skipped=len(pending),
+        seconds=round(time.perf_counter() - start, 2),
+    )
+    LOGGER.info(
+        f"Cache warm-up: {report.warmed} warmed, {report.failed} failed, "
+        f"{report.skipped} skipped after the {budget}s budget, in {report.seconds}s"
+    )
+    return report
@@ -0,0 +1,26 @@
+import argparse
+import asyncio
+
+from .config import settings
+from .main import app
+from .util.warmup import warm_up_cache
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill the shared Redis cache (banners, schools, banner pools, image metadata).")
+    parser.add_argument("--budget", type=float, default=settings.CACHE_WARMUP_BUDGET, help="Seconds to spend before giving up on the rest.")
+    parser.add_argument("--concurrency", type=int, default=settings.CACHE_WARMUP_CONCURRENCY, help="Requests computed at the same time.")
+    args = parser.parse_args()
+
+    if settings.CACHE_TYPE.lower() == "memory":
+        print("CACHE_TYPE=memory keeps the cache inside each server process; there is nothing shared to warm up.")
+        return
+
+    if not settings.CACHE_WARMUP_BASE_URL:
+        print("CACHE_WARMUP_BASE_URL is not set: only the image metadata is warmed (set it to the public origin to warm the lists and banner pools).")
+    print(f"Warming up the cache for at most {args.budget}s...")
+    # The in-process banner samplers belong to the server workers, not to this process
+    report = asyncio.run(warm_up_cache(app, budget=args.budget, concurrency=args.concurrency, samplers=False))
+    print(f"Done. {report.warmed} warmed, {report.failed} failed, {report.skipped} skipped in {report.seconds}s.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+// URLs of the precomputed image renditions served by /api/images (?w= / ?format=webp).
+// The backend picks the nearest width it has built and falls back to the original.
+
+// Display width in CSS pixels; doubled on high-density screens
+export function imageVariant(url: string, width: number): string {
+  if (!url) return url;
+  const pixels = Math.round(width * Math.min(window.devicePixelRatio || 1, 2));
+  const separator = url.includes('?') ? '&' : '?';
+  return `${url}${separator}w=${pixels}&format=webp`;
+}
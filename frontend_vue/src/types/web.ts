@@ -68,6 +68,23 @@ export interface Result {
   is_new: boolean;
 }
 
+// Sprite sheets (one image for all the portraits of a page)
+
+export interface Sprite {
+  x: number;
+  y: number;
+  width: number;
+  height: number;
+}
+
+export interface SpriteSheet {
+  image_url: string;
+  width: number;
+  height: number;
+  tile_width: number;
+  sprites: Record<number, Sprite>;
+}
+
 export interface GachaPull {
   results: Result[];
   unlocked_achievements: Achievement[];